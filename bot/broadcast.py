@@ -5,20 +5,156 @@ Handles mass messaging with rate limiting, progress tracking, and error handling
 
 import logging
 import asyncio
+import re
 import time
-from typing import List, Dict, Any, Optional
-from datetime import datetime
+import weakref
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
+from datetime import datetime, timezone
 
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from aiolimiter import AsyncLimiter
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, MessageEntity
 from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
-from telegram.error import TelegramError, Forbidden, BadRequest
+from telegram.error import TelegramError, Forbidden, BadRequest, RetryAfter, TimedOut, NetworkError
 
 from database import Database
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+# SQL used by the broadcast helpers; constant strings keep hitting the connection's statement cache
+_SQL_COUNT_USERS = '''
+    SELECT COUNT(*)
+    FROM users
+    WHERE subscription_status = 'active'
+    AND last_activity > datetime('now', '-30 days')
+'''
+_SQL_SELECT_USERS = '''
+    SELECT user_id, username, first_name
+    FROM users
+    WHERE subscription_status = 'active'
+    AND last_activity > datetime('now', '-30 days')
+'''
+_SQL_SELECT_BROADCAST = 'SELECT * FROM broadcasts WHERE id = ?'
+_SQL_INSERT_BROADCAST = '''
+    INSERT INTO broadcasts (admin_id, message, target_count, status)
+    VALUES (?, ?, ?, 'pending')
+'''
+_SQL_UPDATE_STATUS = 'UPDATE broadcasts SET status = ? WHERE id = ?'
+_SQL_UPDATE_STATUS_FINAL = '''
+    UPDATE broadcasts
+    SET status = ?, completed_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+'''
+_SQL_UPDATE_PROGRESS = '''
+    UPDATE broadcasts
+    SET success_count = ?, failed_count = ?
+    WHERE id = ?
+'''
+_SQL_FINALIZE = '''
+    UPDATE broadcasts
+    SET success_count = ?, failed_count = ?, status = ?, completed_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+'''
+_SQL_SET_STAGING = 'UPDATE broadcasts SET staging_msg_id = ? WHERE id = ?'
+_SQL_INSERT_FAILURE = '''
+    INSERT OR REPLACE INTO broadcast_failures (broadcast_id, user_id, reason)
+    VALUES (?, ?, ?)
+'''
+_SQL_BLOCK_USER = "UPDATE users SET subscription_status = 'blocked' WHERE user_id = ?"
+_SQL_DELETE_OLD = '''
+    DELETE FROM broadcasts
+    WHERE created_at < datetime('now', ?)
+    AND status IN ('completed', 'failed', 'cancelled')
+'''
+_SQL_DELETE_ORPHAN_FAILURES = '''
+    DELETE FROM broadcast_failures
+    WHERE broadcast_id NOT IN (SELECT id FROM broadcasts)
+'''
+
+# Seconds a stopped broadcast gets to wind down before its task is cancelled outright
+_STOP_GRACE = 10
+
+_STATUS_EMOJI = {
+    'completed': '✅',
+    'failed': '❌',
+    'cancelled': '⏹️',
+    'pending': '⏳'
+}
+
+@lru_cache(maxsize=128)
+def _status_keyboard(broadcast_id: int, active: bool, has_failed: bool) -> InlineKeyboardMarkup:
+    """Build the status message keyboard, cached across refreshes"""
+    refresh = InlineKeyboardButton("🔄 Refresh", callback_data=f"broadcast_status_{broadcast_id}")
+    
+    if active:
+        return InlineKeyboardMarkup([
+            [refresh, InlineKeyboardButton("⏹️ Stop", callback_data=f"broadcast_stop_{broadcast_id}")]
+        ])
+    
+    keyboard = [[refresh]]
+    if has_failed:
+        keyboard.append([InlineKeyboardButton("📋 Failed Users", callback_data=f"broadcast_failed_{broadcast_id}")])
+    
+    return InlineKeyboardMarkup(keyboard)
+
+# Legacy Markdown: ```pre```, `code`, *bold*, _italic_, [text](url) and \-escapes
+_MARKDOWN_RE = re.compile(
+    r"```(?:([\w+-]+)\n)?(.*?)```|`([^`]+)`|\*([^*]+)\*|_([^_]+)_|\[([^\]]+)\]\(([^)\s]+)\)|\\([_*`\[])",
+    re.DOTALL
+)
+
+def _utf16_len(text: str) -> int:
+    """Length in UTF-16 code units, as used by entity offsets"""
+    return len(text.encode('utf-16-le')) // 2
+
+@lru_cache(maxsize=32)
+def _render_markdown(message: str) -> Tuple[str, Tuple[MessageEntity, ...]]:
+    """Convert Markdown to plain text plus entities so Telegram doesn't parse it per send"""
+    parts = []
+    entities = []
+    offset = 0
+    pos = 0
+    
+    for match in _MARKDOWN_RE.finditer(message):
+        literal = message[pos:match.start()]
+        parts.append(literal)
+        offset += _utf16_len(literal)
+        pos = match.end()
+        
+        language, pre, code, bold, italic, link_text, url, escaped = match.groups()
+        extra = {}
+        if escaped is not None:
+            parts.append(escaped)
+            offset += 1
+            continue
+        elif pre is not None:
+            content, kind = pre, MessageEntity.PRE
+            if language:
+                extra['language'] = language
+        elif code is not None:
+            content, kind = code, MessageEntity.CODE
+        elif bold is not None:
+            content, kind = bold, MessageEntity.BOLD
+        elif italic is not None:
+            content, kind = italic, MessageEntity.ITALIC
+        else:
+            content, kind = link_text, MessageEntity.TEXT_LINK
+            extra['url'] = url
+        
+        length = _utf16_len(content)
+        if length:
+            entities.append(MessageEntity(type=kind, offset=offset, length=length, **extra))
+        parts.append(content)
+        offset += length
+    
+    parts.append(message[pos:])
+    return ''.join(parts), tuple(entities)
+
+class _ChatLimiter(AsyncLimiter):
+    """AsyncLimiter that can be held in a WeakValueDictionary"""
+
 class BroadcastManager:
     """Advanced broadcast management with rate limiting and analytics"""
     
@@ -27,20 +163,34 @@ class BroadcastManager:
         self.config = config
         self.active_broadcasts = {}  # Track active broadcasts
         self.broadcast_lock = asyncio.Lock()
+        
+        # Global send rate (token bucket) and in-flight request cap
+        self._limiter = AsyncLimiter(config.BROADCAST_RATE, 1.0)
+        self._sem = asyncio.Semaphore(config.BROADCAST_CONCURRENCY)
+        
+        # Per-chat limiters, alive only while a send to that chat is in progress
+        self._user_limiters = weakref.WeakValueDictionary()
+        
+        # Write-behind progress counters and their flusher tasks
+        self._progress = {}
+        self._progress_flushers = {}
+        
+        # Broadcast rows, only ever modified through this class
+        self._record_cache: Dict[int, Dict] = {}
     
     async def start_broadcast(self, message: str, admin_id: int, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Start a new broadcast to all users"""
         try:
             async with self.broadcast_lock:
-                # Get all active users
-                users = await self._get_broadcast_users()
+                # Count all active users
+                user_count = await self._count_broadcast_users()
                 
-                if not users:
+                if not user_count:
                     await update.message.reply_text("❌ No users found for broadcast")
                     return
                 
                 # Create broadcast record
-                broadcast_id = await self._create_broadcast_record(admin_id, message, len(users))
+                broadcast_id = await self._create_broadcast_record(admin_id, message, user_count)
                 
                 if not broadcast_id:
                     await update.message.reply_text("❌ Failed to create broadcast record")
@@ -57,11 +207,11 @@ class BroadcastManager:
                 
                 await update.message.reply_text(
                     f"📢 **Broadcast Ready**\n\n"
-                    f"👥 **Target Users:** {len(users):,}\n"
+                    f"👥 **Target Users:** {user_count:,}\n"
                     f"📝 **Message Preview:**\n"
                     f"```\n{message[:500]}{'...' if len(message) > 500 else ''}\n```\n\n"
                     f"⚠️ **Warning:** This will send to ALL active users!\n"
-                    f"📊 **Estimated Time:** {self._estimate_broadcast_time(len(users))}",
+                    f"📊 **Estimated Time:** {self._estimate_broadcast_time(user_count)}",
                     parse_mode=ParseMode.MARKDOWN,
                     reply_markup=reply_markup
                 )
@@ -79,11 +229,28 @@ class BroadcastManager:
                 await update.callback_query.message.reply_text("❌ Broadcast not found")
                 return
             
+            # Stage the message once so delivery can use server-side copyMessage
+            if self.config.STAGING_CHAT_ID and not broadcast.get('staging_msg_id'):
+                try:
+                    text, entities = _render_markdown(broadcast['message'])
+                    sent = await context.bot.send_message(
+                        chat_id=self.config.STAGING_CHAT_ID,
+                        text=text,
+                        entities=entities,
+                        disable_web_page_preview=True
+                    )
+                    await self._set_staging_message(broadcast_id, sent.message_id)
+                except TelegramError as e:
+                    logger.warning(f"Failed to stage broadcast {broadcast_id}, sending directly: {e}")
+            
             # Start broadcast task
-            task = asyncio.create_task(self._execute_broadcast(broadcast_id, context))
+            cancel_event = asyncio.Event()
+            task = asyncio.create_task(self._execute_broadcast(broadcast_id, context, cancel_event))
             self.active_broadcasts[broadcast_id] = {
                 'task': task,
+                'cancel': cancel_event,
                 'started_at': datetime.now(),
+                'started_at_mono': time.monotonic(),
                 'status': 'running'
             }
             
@@ -111,41 +278,42 @@ class BroadcastManager:
     async def get_broadcast_status(self, broadcast_id: int, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Get broadcast status and statistics"""
         try:
-            broadcast = await self._get_broadcast_record(broadcast_id)
+            # Check if broadcast is active
+            active_info = self.active_broadcasts.get(broadcast_id)
+            is_active = active_info is not None and broadcast_id in self._record_cache
+            
+            if is_active:
+                # Live counters straight from memory, without touching the database
+                broadcast = dict(self._record_cache[broadcast_id])
+                progress = self._progress.get(broadcast_id)
+                if progress:
+                    broadcast['success_count'] = progress['ok']
+                    broadcast['failed_count'] = progress['fail']
+            else:
+                broadcast = await self._get_broadcast_record(broadcast_id)
+            
             if not broadcast:
                 await update.message.reply_text("❌ Broadcast not found")
                 return
             
-            # Check if broadcast is active
-            is_active = broadcast_id in self.active_broadcasts
-            
             message = f"📊 **Broadcast Status** (ID: {broadcast_id})\n\n"
             
             if is_active:
-                active_info = self.active_broadcasts[broadcast_id]
-                elapsed = datetime.now() - active_info['started_at']
+                elapsed = time.monotonic() - active_info['started_at_mono']
                 
                 message += (
                     f"🔄 **Status:** Running\n"
-                    f"⏱️ **Running Time:** {self._format_duration(elapsed.total_seconds())}\n"
+                    f"⏱️ **Running Time:** {self._format_duration(int(elapsed))}\n"
                     f"📤 **Sent:** {broadcast['success_count']:,}\n"
                     f"❌ **Failed:** {broadcast['failed_count']:,}\n"
                     f"📊 **Progress:** {self._calculate_progress(broadcast)}%\n"
                     f"🎯 **Target:** {broadcast['target_count']:,}\n\n"
-                    f"📈 **Rate:** ~{self._calculate_send_rate(broadcast, elapsed.total_seconds())} msg/min"
+                    f"📈 **Rate:** ~{self._calculate_send_rate(broadcast, elapsed)} msg/min"
                 )
                 
-                keyboard = [
-                    [InlineKeyboardButton("🔄 Refresh", callback_data=f"broadcast_status_{broadcast_id}"),
-                     InlineKeyboardButton("⏹️ Stop", callback_data=f"broadcast_stop_{broadcast_id}")]
-                ]
+                reply_markup = _status_keyboard(broadcast_id, True, False)
             else:
-                status_emoji = {
-                    'completed': '✅',
-                    'failed': '❌',
-                    'cancelled': '⏹️',
-                    'pending': '⏳'
-                }.get(broadcast['status'], '❓')
+                status_emoji = _STATUS_EMOJI.get(broadcast['status'], '❓')
                 
                 message += (
                     f"{status_emoji} **Status:** {broadcast['status'].title()}\n"
@@ -158,21 +326,15 @@ class BroadcastManager:
                     completed_time = datetime.fromisoformat(broadcast['completed_at'])
                     created_time = datetime.fromisoformat(broadcast['created_at'])
                     duration = completed_time - created_time
-                    message += f"⏱️ **Duration:** {self._format_duration(duration.total_seconds())}\n"
+                    message += f"⏱️ **Duration:** {self._format_duration(int(duration.total_seconds()))}\n"
                 
                 # Calculate success rate
                 if broadcast['target_count'] > 0:
                     success_rate = (broadcast['success_count'] / broadcast['target_count']) * 100
                     message += f"📈 **Success Rate:** {success_rate:.1f}%"
                 
-                keyboard = [
-                    [InlineKeyboardButton("🔄 Refresh", callback_data=f"broadcast_status_{broadcast_id}")]
-                ]
-                
-                if broadcast['status'] == 'completed' and broadcast['failed_count'] > 0:
-                    keyboard.append([InlineKeyboardButton("📋 Failed Users", callback_data=f"broadcast_failed_{broadcast_id}")])
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
+                has_failed = broadcast['status'] == 'completed' and broadcast['failed_count'] > 0
+                reply_markup = _status_keyboard(broadcast_id, False, has_failed)
             
             await update.message.reply_text(
                 message,
@@ -191,16 +353,15 @@ class BroadcastManager:
                 await update.callback_query.message.reply_text("❌ Broadcast is not running")
                 return
             
-            # Cancel the task
+            # Signal the task; it stops at its next check, finalizes and stores the failures itself
             broadcast_info = self.active_broadcasts[broadcast_id]
-            broadcast_info['task'].cancel()
+            broadcast_info['cancel'].set()
             broadcast_info['status'] = 'cancelled'
             
-            # Update database
-            await self._update_broadcast_status(broadcast_id, 'cancelled')
-            
-            # Remove from active broadcasts
-            del self.active_broadcasts[broadcast_id]
+            task = broadcast_info['task']
+            done, _ = await asyncio.wait({task}, timeout=_STOP_GRACE)
+            if not done:
+                task.cancel()
             
             await update.callback_query.message.reply_text(
                 f"⏹️ **Broadcast Stopped**\n\n"
@@ -216,69 +377,46 @@ class BroadcastManager:
             logger.error(f"Error stopping broadcast: {e}")
             await update.callback_query.message.reply_text("❌ Failed to stop broadcast")
     
-    async def _execute_broadcast(self, broadcast_id: int, context: ContextTypes.DEFAULT_TYPE):
+    async def _execute_broadcast(self, broadcast_id: int, context: ContextTypes.DEFAULT_TYPE, cancel_event: asyncio.Event):
         """Execute the actual broadcast"""
+        failed_users = []
         try:
             broadcast = await self._get_broadcast_record(broadcast_id)
             if not broadcast:
                 logger.error(f"Broadcast {broadcast_id} not found")
                 return
             
-            # Get users to broadcast to
-            users = await self._get_broadcast_users()
+            # Live counters, persisted periodically by the flusher task
+            progress = {'ok': 0, 'fail': 0, 'dirty': False}
+            self._progress[broadcast_id] = progress
+            self._progress_flushers[broadcast_id] = asyncio.create_task(self._progress_flusher(broadcast_id))
             
-            success_count = 0
-            failed_count = 0
-            failed_users = []
+            logger.info(f"Starting broadcast {broadcast_id} to {broadcast['target_count']} users")
             
-            logger.info(f"Starting broadcast {broadcast_id} to {len(users)} users")
-            
-            for i, user in enumerate(users):
-                try:
-                    # Check if broadcast was cancelled
-                    if broadcast_id not in self.active_broadcasts:
-                        logger.info(f"Broadcast {broadcast_id} was cancelled")
-                        break
-                    
-                    # Send message to user
-                    await context.bot.send_message(
-                        chat_id=user['user_id'],
-                        text=broadcast['message'],
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                    
-                    success_count += 1
-                    
-                    # Update progress every 50 messages
-                    if (i + 1) % 50 == 0:
-                        await self._update_broadcast_progress(broadcast_id, success_count, failed_count)
-                    
-                    # Rate limiting
-                    await asyncio.sleep(self.config.BROADCAST_DELAY)
-                    
-                except Forbidden:
-                    # User blocked the bot
-                    failed_count += 1
-                    failed_users.append({'user_id': user['user_id'], 'reason': 'blocked'})
-                    
-                except BadRequest as e:
-                    # Invalid chat ID or other bad request
-                    failed_count += 1
-                    failed_users.append({'user_id': user['user_id'], 'reason': str(e)})
-                    
-                except Exception as e:
-                    # Other errors
-                    failed_count += 1
-                    failed_users.append({'user_id': user['user_id'], 'reason': str(e)})
-                    logger.error(f"Error sending to user {user['user_id']}: {e}")
+            # Users are streamed from the database and sent in chunks
+            chunk_size = self.config.BROADCAST_CHUNK_SIZE
+            chunk = []
+            async for user in self._iter_broadcast_users():
+                chunk.append(user)
+                if len(chunk) < chunk_size:
+                    continue
+                
+                # Check if broadcast was cancelled, once per chunk
+                if cancel_event.is_set():
+                    break
                 
-                # Check if we're sending too fast
-                if (i + 1) % 100 == 0:
-                    await asyncio.sleep(1)  # Extra delay every 100 messages
+                failed_users.extend(await self._send_chunk(context, chunk, broadcast, progress, cancel_event))
+                chunk = []
+            
+            if cancel_event.is_set():
+                logger.info(f"Broadcast {broadcast_id} was cancelled")
+            elif chunk:
+                failed_users.extend(await self._send_chunk(context, chunk, broadcast, progress, cancel_event))
             
             # Final update
-            await self._update_broadcast_progress(broadcast_id, success_count, failed_count)
-            await self._update_broadcast_status(broadcast_id, 'completed')
+            self._stop_progress_flusher(broadcast_id)
+            await self._finalize_broadcast(broadcast_id, progress['ok'], progress['fail'],
+                                           'cancelled' if cancel_event.is_set() else 'completed')
             
             # Store failed users info
             if failed_users:
@@ -288,66 +426,217 @@ class BroadcastManager:
             if broadcast_id in self.active_broadcasts:
                 del self.active_broadcasts[broadcast_id]
             
-            logger.info(f"Broadcast {broadcast_id} completed: {success_count} sent, {failed_count} failed")
+            logger.info(f"Broadcast {broadcast_id} completed: {progress['ok']} sent, {progress['fail']} failed")
             
         except asyncio.CancelledError:
             logger.info(f"Broadcast {broadcast_id} was cancelled")
-            await self._update_broadcast_status(broadcast_id, 'cancelled')
+            progress = self._stop_progress_flusher(broadcast_id)
+            await self._finalize_broadcast(broadcast_id, progress['ok'], progress['fail'], 'cancelled')
+            
+            # Keep the failures from the chunks that did finish
+            if failed_users:
+                await self._store_failed_users(broadcast_id, failed_users)
+            
+            self.active_broadcasts.pop(broadcast_id, None)
+            raise
             
         except Exception as e:
             logger.error(f"Error executing broadcast {broadcast_id}: {e}")
-            await self._update_broadcast_status(broadcast_id, 'failed')
+            progress = self._stop_progress_flusher(broadcast_id)
+            await self._finalize_broadcast(broadcast_id, progress['ok'], progress['fail'], 'failed')
             
             if broadcast_id in self.active_broadcasts:
                 del self.active_broadcasts[broadcast_id]
     
-    async def _get_broadcast_users(self) -> List[Dict]:
-        """Get all users eligible for broadcast"""
+    async def _progress_flusher(self, broadcast_id: int):
+        """Periodically persist live broadcast counters (write-behind)"""
+        progress = self._progress[broadcast_id]
+        
+        while True:
+            await asyncio.sleep(self.config.BROADCAST_PROGRESS_INTERVAL)
+            
+            if progress['dirty']:
+                progress['dirty'] = False
+                await self._update_broadcast_progress(broadcast_id, progress['ok'], progress['fail'])
+    
+    def _stop_progress_flusher(self, broadcast_id: int) -> Dict:
+        """Cancel the progress flusher and return the final counters"""
+        flusher = self._progress_flushers.pop(broadcast_id, None)
+        if flusher:
+            flusher.cancel()
+        
+        return self._progress.pop(broadcast_id, None) or {'ok': 0, 'fail': 0}
+    
+    def _user_limiter(self, user_id: int) -> AsyncLimiter:
+        """Get the per-chat limiter (1 msg/sec) for a user"""
+        limiter = self._user_limiters.get(user_id)
+        if limiter is None:
+            limiter = _ChatLimiter(1, 1.0)
+            self._user_limiters[user_id] = limiter
+        return limiter
+    
+    async def _send_chunk(self, context: ContextTypes.DEFAULT_TYPE, chunk: List[Dict], broadcast: Dict,
+                          progress: Dict, cancel_event: asyncio.Event) -> List[Dict]:
+        """Send to a chunk of users concurrently, returns the failed users"""
+        tasks = [asyncio.create_task(self._send_one(context, user, broadcast, progress)) for user in chunk]
+        sends = asyncio.gather(*tasks, return_exceptions=True)
+        cancelled = asyncio.create_task(cancel_event.wait())
+        
         try:
-            with self.db.lock:
-                cursor = self.db.connection.cursor()
-                # Get users active in last 30 days
-                cursor.execute('''
-                    SELECT user_id, username, first_name 
-                    FROM users 
-                    WHERE subscription_status = 'active'
-                    AND last_activity > datetime('now', '-30 days')
-                    ORDER BY last_activity DESC
-                ''')
+            # Abandon the rest of the chunk as soon as the broadcast is cancelled
+            await asyncio.wait([sends, cancelled], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            cancelled.cancel()
+            if not sends.done():
+                for task in tasks:
+                    task.cancel()
+        
+        results = await sends
+        
+        # Cancelled sends have no result
+        return [
+            {'user_id': result[0], 'reason': result[2]}
+            for result in results if isinstance(result, tuple) and not result[1]
+        ]
+    
+    async def _send_one(self, context: ContextTypes.DEFAULT_TYPE, user: Dict, broadcast: Dict, progress: Dict) -> Optional[Tuple[int, bool, Optional[str]]]:
+        """Send broadcast message to a single user, returns (user_id, ok, reason)"""
+        try:
+            user_id, ok, reason = await self._deliver(context, user['user_id'], broadcast)
+        except asyncio.CancelledError:
+            # Broadcast stopped mid-chunk
+            return None
+        
+        # Single-threaded event loop - plain increments are safe
+        if ok:
+            progress['ok'] += 1
+        else:
+            progress['fail'] += 1
+        progress['dirty'] = True
+        
+        return user_id, ok, reason
+    
+    async def _deliver(self, context: ContextTypes.DEFAULT_TYPE, user_id: int, broadcast: Dict) -> Tuple[int, bool, Optional[str]]:
+        """Deliver a message to one chat with rate limiting and retries"""
+        staging_msg_id = broadcast.get('staging_msg_id')
+        # Held for the whole retry loop so retries to this chat stay spaced out
+        chat_limiter = self._user_limiter(user_id)
+        reason = None
+        
+        for attempt in range(3):
+            try:
+                # Slot first, global token last: a token is only spent when the send goes out right away
+                async with self._sem, chat_limiter, self._limiter:
+                    if staging_msg_id:
+                        # Server-side copy of the staged message
+                        await context.bot.copy_message(
+                            chat_id=user_id,
+                            from_chat_id=self.config.STAGING_CHAT_ID,
+                            message_id=staging_msg_id
+                        )
+                    else:
+                        # Pre-rendered entities, so the server skips Markdown parsing
+                        text, entities = _render_markdown(broadcast['message'])
+                        await context.bot.send_message(
+                            chat_id=user_id,
+                            text=text,
+                            entities=entities,
+                            disable_web_page_preview=True
+                        )
+                return user_id, True, None
+                
+            except RetryAfter as e:
+                # Flood control - wait the server-advertised interval, then retry
+                reason = str(e)
+                await asyncio.sleep(e.retry_after + 0.1)
+                
+            except Forbidden:
+                # User blocked the bot
+                return user_id, False, 'blocked'
+                
+            except BadRequest as e:
+                # Invalid chat ID or other bad request
+                return user_id, False, str(e)
+                
+            except (TimedOut, NetworkError) as e:
+                # Transient network failure - exponential backoff
+                reason = str(e)
+                await asyncio.sleep(2 ** attempt)
+                
+            except Exception as e:
+                # Other errors
+                logger.error(f"Error sending to user {user_id}: {e}")
+                return user_id, False, str(e)
+        
+        logger.warning(f"Giving up on user {user_id} after retries: {reason}")
+        return user_id, False, reason
+    
+    async def _count_broadcast_users(self) -> int:
+        """Count users eligible for broadcast"""
+        try:
+            cursor = self.db.read_conn().cursor()
+            cursor.execute(_SQL_COUNT_USERS)
+            
+            return cursor.fetchone()[0]
+                
+        except Exception as e:
+            logger.error(f"Error counting broadcast users: {e}")
+            return 0
+    
+    async def _iter_broadcast_users(self, batch: int = 1000) -> AsyncIterator[Dict]:
+        """Stream users eligible for broadcast in batches"""
+        try:
+            # Read-only connection, so writes on the main connection aren't blocked
+            cursor = self.db.read_conn().cursor()
+            # Get users active in last 30 days
+            cursor.execute(_SQL_SELECT_USERS)
+            
+            while True:
+                rows = cursor.fetchmany(batch)
                 
-                return [dict(row) for row in cursor.fetchall()]
+                if not rows:
+                    break
                 
+                for row in rows:
+                    yield dict(row)
+                    
         except Exception as e:
             logger.error(f"Error getting broadcast users: {e}")
-            return []
     
     async def _create_broadcast_record(self, admin_id: int, message: str, target_count: int) -> Optional[int]:
         """Create broadcast record in database"""
         try:
             with self.db.lock:
                 cursor = self.db.connection.cursor()
-                cursor.execute('''
-                    INSERT INTO broadcasts (admin_id, message, target_count, status)
-                    VALUES (?, ?, ?, 'pending')
-                ''', (admin_id, message, target_count))
+                cursor.execute(_SQL_INSERT_BROADCAST, (admin_id, message, target_count))
                 self.db.connection.commit()
-                return cursor.lastrowid
+                broadcast_id = cursor.lastrowid
+                
+                # Seed the cache with the stored row (server-side defaults included)
+                cursor.execute(_SQL_SELECT_BROADCAST, (broadcast_id,))
+                self._record_cache[broadcast_id] = dict(cursor.fetchone())
+                return broadcast_id
                 
         except Exception as e:
             logger.error(f"Error creating broadcast record: {e}")
             return None
     
     async def _get_broadcast_record(self, broadcast_id: int) -> Optional[Dict]:
-        """Get broadcast record from database"""
+        """Get broadcast record, from cache when available"""
+        record = self._record_cache.get(broadcast_id)
+        if record is not None:
+            return record
+        
         try:
-            with self.db.lock:
-                cursor = self.db.connection.cursor()
-                cursor.execute('SELECT * FROM broadcasts WHERE id = ?', (broadcast_id,))
-                row = cursor.fetchone()
-                
-                if row:
-                    return dict(row)
-                return None
+            cursor = self.db.read_conn().cursor()
+            cursor.execute(_SQL_SELECT_BROADCAST, (broadcast_id,))
+            row = cursor.fetchone()
+            
+            if row:
+                record = dict(row)
+                self._record_cache[broadcast_id] = record
+                return record
+            return None
                 
         except Exception as e:
             logger.error(f"Error getting broadcast record: {e}")
@@ -356,35 +645,70 @@ class BroadcastManager:
     async def _update_broadcast_status(self, broadcast_id: int, status: str):
         """Update broadcast status"""
         try:
+            record = self._record_cache.get(broadcast_id)
+            if record is not None:
+                record['status'] = status
+                if status in ['completed', 'failed', 'cancelled']:
+                    # Same format as SQLite's CURRENT_TIMESTAMP (UTC)
+                    record['completed_at'] = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+            
             with self.db.lock:
                 cursor = self.db.connection.cursor()
                 
                 if status in ['completed', 'failed', 'cancelled']:
-                    cursor.execute('''
-                        UPDATE broadcasts 
-                        SET status = ?, completed_at = CURRENT_TIMESTAMP 
-                        WHERE id = ?
-                    ''', (status, broadcast_id))
+                    cursor.execute(_SQL_UPDATE_STATUS_FINAL, (status, broadcast_id))
                 else:
-                    cursor.execute('''
-                        UPDATE broadcasts SET status = ? WHERE id = ?
-                    ''', (status, broadcast_id))
+                    cursor.execute(_SQL_UPDATE_STATUS, (status, broadcast_id))
                 
                 self.db.connection.commit()
                 
         except Exception as e:
             logger.error(f"Error updating broadcast status: {e}")
     
+    async def _finalize_broadcast(self, broadcast_id: int, success_count: int, failed_count: int, status: str):
+        """Write final counters and terminal status in a single statement"""
+        try:
+            record = self._record_cache.get(broadcast_id)
+            if record is not None:
+                record['success_count'] = success_count
+                record['failed_count'] = failed_count
+                record['status'] = status
+                record['completed_at'] = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+            
+            with self.db.lock:
+                cursor = self.db.connection.cursor()
+                cursor.execute(_SQL_FINALIZE, (success_count, failed_count, status, broadcast_id))
+                self.db.connection.commit()
+                
+        except Exception as e:
+            logger.error(f"Error finalizing broadcast: {e}")
+    
+    async def _set_staging_message(self, broadcast_id: int, staging_msg_id: int):
+        """Store the staged template message id for a broadcast"""
+        try:
+            record = self._record_cache.get(broadcast_id)
+            if record is not None:
+                record['staging_msg_id'] = staging_msg_id
+            
+            with self.db.lock:
+                cursor = self.db.connection.cursor()
+                cursor.execute(_SQL_SET_STAGING, (staging_msg_id, broadcast_id))
+                self.db.connection.commit()
+                
+        except Exception as e:
+            logger.error(f"Error storing staging message: {e}")
+    
     async def _update_broadcast_progress(self, broadcast_id: int, success_count: int, failed_count: int):
         """Update broadcast progress"""
         try:
+            record = self._record_cache.get(broadcast_id)
+            if record is not None:
+                record['success_count'] = success_count
+                record['failed_count'] = failed_count
+            
             with self.db.lock:
                 cursor = self.db.connection.cursor()
-                cursor.execute('''
-                    UPDATE broadcasts 
-                    SET success_count = ?, failed_count = ? 
-                    WHERE id = ?
-                ''', (success_count, failed_count, broadcast_id))
+                cursor.execute(_SQL_UPDATE_PROGRESS, (success_count, failed_count, broadcast_id))
                 self.db.connection.commit()
                 
         except Exception as e:
@@ -393,15 +717,27 @@ class BroadcastManager:
     async def _store_failed_users(self, broadcast_id: int, failed_users: List[Dict]):
         """Store failed users information"""
         try:
-            # This could be stored in a separate table if needed
-            # For now, we'll log it
-            failed_user_ids = [user['user_id'] for user in failed_users]
-            self.db.log_action(
-                "WARNING", 
-                f"Broadcast failed users", 
-                None, 
-                f"Broadcast ID: {broadcast_id}, Failed: {failed_user_ids}"
-            )
+            with self.db.lock:
+                cursor = self.db.connection.cursor()
+                cursor.executemany(_SQL_INSERT_FAILURE, [(broadcast_id, user['user_id'], user['reason']) for user in failed_users])
+                self.db.connection.commit()
+            
+            self.db.log_action("WARNING", "Broadcast failed users", None,
+                               f"Broadcast ID: {broadcast_id}, Failed: {len(failed_users)}")
+            
+            # Users who blocked the bot or no longer exist are dropped from future broadcasts
+            unreachable = [
+                (user['user_id'],) for user in failed_users
+                if user['reason'] == 'blocked' or 'chat not found' in (user['reason'] or '').lower()
+            ]
+            
+            if unreachable:
+                with self.db.lock:
+                    cursor = self.db.connection.cursor()
+                    cursor.executemany(_SQL_BLOCK_USER, unreachable)
+                    self.db.connection.commit()
+                
+                logger.info(f"Deactivated {len(unreachable)} unreachable users after broadcast {broadcast_id}")
             
         except Exception as e:
             logger.error(f"Error storing failed users: {e}")
@@ -409,14 +745,10 @@ class BroadcastManager:
     def _estimate_broadcast_time(self, user_count: int) -> str:
         """Estimate broadcast completion time"""
         try:
-            # Calculate based on delay and rate limiting
-            total_seconds = user_count * self.config.BROADCAST_DELAY
-            
-            # Add extra time for rate limiting
-            extra_time = (user_count // 100) * 1  # 1 second per 100 messages
-            total_seconds += extra_time
+            # Sends are bounded by the global rate limiter
+            total_seconds = user_count / self.config.BROADCAST_RATE
             
-            return self._format_duration(total_seconds)
+            return self._format_duration(int(total_seconds))
             
         except Exception:
             return "Unknown"
@@ -448,11 +780,11 @@ class BroadcastManager:
         except Exception:
             return "0"
     
-    def _format_duration(self, seconds: float) -> str:
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _format_duration(seconds: int) -> str:
         """Format duration in human readable format"""
         try:
-            seconds = int(seconds)
-            
             if seconds < 60:
                 return f"{seconds}s"
             elif seconds < 3600:
@@ -474,16 +806,20 @@ class BroadcastManager:
         try:
             with self.db.lock:
                 cursor = self.db.connection.cursor()
-                cursor.execute('''
-                    DELETE FROM broadcasts 
-                    WHERE created_at < datetime('now', '-{} days')
-                    AND status IN ('completed', 'failed', 'cancelled')
-                '''.format(days))
+                cursor.execute(_SQL_DELETE_OLD, (f'-{int(days)} days',))
                 
                 deleted_count = cursor.rowcount
+                cursor.execute(_SQL_DELETE_ORPHAN_FAILURES)
                 self.db.connection.commit()
                 
+                # Drop cached records that are no longer active
+                for broadcast_id in list(self._record_cache):
+                    if broadcast_id not in self.active_broadcasts:
+                        del self._record_cache[broadcast_id]
+                
                 if deleted_count > 0:
+                    # Reclaim freed pages (requires auto_vacuum=INCREMENTAL)
+                    cursor.execute('PRAGMA incremental_vacuum(1000)')
                     logger.info(f"Cleaned up {deleted_count} old broadcast records")
                 
         except Exception as e:
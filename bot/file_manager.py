@@ -4,14 +4,20 @@ Handles all file operations, processing, and queue management
 """
 
 import logging
+import asyncio
+import operator
 import os
+import queue
 import tempfile
 import threading
-from typing import Dict, List, Any, Optional, Tuple
+import time
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Set, Tuple
 from datetime import datetime
-import queue as Queue
+import requests
 import telebot
-from telebot import types
+from telebot import types, apihelper
 
 from database import Database
 from config import Config
@@ -21,208 +27,326 @@ from utils.patterns import PatternManager
 
 logger = logging.getLogger(__name__)
 
+_SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
+
+_UPLOAD_TEMPLATE = """
+📁 **File Received!**
+
+**File Details:**
+• Name: `{name}`
+• Size: {size}
+• Type: {type}
+
+**What would you like to do?**
+"""
+
+_RENAME_TEMPLATE = """
+✏️ **Rename File**
+
+Current name: `{name}`
+
+**Options:**
+1️⃣ Send new filename
+2️⃣ Use naming pattern
+3️⃣ Auto-rename with counter
+
+Send the new filename or choose an option:
+"""
+
+# File options keyboard: rows of (title, callback prefix)
+_FILE_ACTIONS = (
+    (("✏️ Rename", "file_rename_"), ("🖼️ Thumbnail", "file_thumb_")),
+    (("📊 Metadata", "file_meta_"), ("💬 Caption", "file_caption_")),
+    (("🔄 Add to Batch", "file_batch_"), ("⚡ Process Now", "file_process_"))
+)
+
 class FileManager:
     """Advanced file management with queue processing"""
     
-    def __init__(self, database: Database, config: Config):
+    _QUEUE_COUNTS_TTL = 1.0  # Seconds; status is polled repeatedly
+    _MEDIA_GROUP_DEBOUNCE = 0.3  # Seconds to wait for the next part of an album
+    _DB_WRITE_ATTEMPTS = 5  # Tries per temp file row before giving up
+    
+    # file_type -> message attribute holding the file
+    _FILE_ACCESSORS = {
+        'document': operator.attrgetter('document'),
+        'photo': lambda m: m.photo[-1] if m.photo else None,  # Highest resolution
+        'video': operator.attrgetter('video'),
+        'audio': operator.attrgetter('audio'),
+        'voice': operator.attrgetter('voice'),
+        'video_note': operator.attrgetter('video_note'),
+        'animation': operator.attrgetter('animation')
+    }
+    
+    def __init__(self, database: Database, config: Config, bot: telebot.TeleBot):
         self.db = database
         self.config = config
+        self.bot = bot
         self.file_utils = FileUtils(config)
         self.metadata_utils = MetadataUtils()
         self.pattern_manager = PatternManager(database)
         
-        # Processing queues
-        self.upload_queue = Queue.Queue(maxsize=config.MAX_QUEUE_SIZE)
-        self.download_queue = Queue.Queue(maxsize=config.MAX_QUEUE_SIZE)
+        # Concurrency gates, created on the event loop
+        self._album_sem: Optional[asyncio.Semaphore] = None
+        self._tasks = set()
+        self._pending_files = 0  # Received files not yet handled; written on the loop, readable from any thread
+        self._total_workers = config.CONCURRENT_UPLOADS + config.CONCURRENT_DOWNLOADS
+        self._queue_counts_cache: Dict[int, Tuple[float, Dict[str, int]]] = {}
         
-        # Track active operations
-        self.active_uploads = {}
-        self.active_downloads = {}
+        # Write-behind storage of received files; the cache covers rows not yet written
+        self._temp_cache: Dict[Tuple[int, str], Dict] = {}
+        self._temp_lock = threading.Lock()  # Written on the event loop, evicted by the writer thread
+        self._db_write_q = queue.Queue()
+        threading.Thread(target=self._db_writer, daemon=True, name="FileManagerDBWriter").start()
         
-        # Start worker threads
-        self._start_worker_threads()
-    
-    def _start_worker_threads(self):
-        """Start worker threads for concurrent processing"""
-        # Upload workers
-        for i in range(self.config.CONCURRENT_UPLOADS):
-            worker = threading.Thread(
-                target=self._upload_worker,
-                daemon=True,
-                name=f"UploadWorker-{i}"
-            )
-            worker.start()
+        # Shared HTTP session for ranged file downloads
+        self._http = requests.Session()
+        self._http.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=config.DOWNLOAD_CONNECTIONS))
         
-        # Download workers  
-        for i in range(self.config.CONCURRENT_DOWNLOADS):
-            worker = threading.Thread(
-                target=self._download_worker,
-                daemon=True,
-                name=f"DownloadWorker-{i}"
-            )
-            worker.start()
+        # Per-chat upload queues, each drained in order by one worker task (event loop thread only)
+        self._chat_queues: Dict[int, asyncio.Queue] = {}
+        self._chat_workers: Dict[int, asyncio.Task] = {}
+        
+        # Users with an active operation; only mutated on the event loop thread
+        self.active_uploads: Set[int] = set()
+        self.active_downloads: Set[int] = set()
+        
+        # file_<action>_<file_id> callback dispatch
+        self._callback_dispatch = {
+            'rename': self._handle_rename_request,
+            'thumb': self._handle_thumbnail_request,
+            'meta': self._handle_metadata_request,
+            'caption': self._handle_caption_request,
+            'batch': self._handle_batch_request,
+            'process': self._handle_process_request
+        }
         
-        logger.info("File processing workers started")
+        # Single event loop thread for all transfers; blocking calls go to a sized pool
+        self._io_pool = ThreadPoolExecutor(
+            max_workers=config.CONCURRENT_UPLOADS + config.CONCURRENT_DOWNLOADS * config.DOWNLOAD_CONNECTIONS,
+            thread_name_prefix="FileIO"
+        )
+        self._loop = asyncio.new_event_loop()
+        self._loop.set_default_executor(self._io_pool)
+        self._start_event_loop()
     
-    def _upload_worker(self):
-        """Worker thread for processing upload queue"""
-        while True:
-            try:
-                task = self.upload_queue.get(timeout=30)
-                if task is None:  # Shutdown signal
-                    break
-                    
-                self._process_upload_task(task)
-                self.upload_queue.task_done()
-                
-            except Queue.Empty:
-                continue
-            except Exception as e:
-                logger.error(f"Upload worker error: {e}")
-                self.upload_queue.task_done()
+    def _start_event_loop(self):
+        """Run the transfer event loop in a background thread"""
+        threading.Thread(target=self._loop.run_forever, daemon=True, name="FileManagerLoop").start()
+        asyncio.run_coroutine_threadsafe(self._init_gates(), self._loop).result()
+        
+        logger.info("File processing loop started")
+    
+    async def _init_gates(self):
+        """Create the semaphores inside the running loop"""
+        self._album_sem = asyncio.Semaphore(self.config.MAX_CONCURRENT_UPLOADS)
     
-    def _download_worker(self):
-        """Worker thread for processing download queue"""
+    def _spawn(self, coro) -> asyncio.Task:
+        """Create a task and keep a reference until it finishes"""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+    
+    def _db_writer(self):
+        """Persist queued temp files in batches of up to 100 rows or 50 ms, retrying failed batches"""
         while True:
-            try:
-                task = self.download_queue.get(timeout=30)
-                if task is None:  # Shutdown signal
+            batch = [self._db_write_q.get()]
+            deadline = time.monotonic() + 0.05
+            while len(batch) < 100:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
                     break
-                    
-                self._process_download_task(task)
-                self.download_queue.task_done()
-                
-            except Queue.Empty:
+                try:
+                    batch.append(self._db_write_q.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            
+            if not self.db.store_temp_files_bulk([(user_id, file_info) for user_id, file_info, _ in batch]):
+                # Not committed: back off, then queue the rows again while the cache keeps serving them
+                time.sleep(min(0.5 * 2 ** max(tries for _, _, tries in batch), 10))
+                for user_id, file_info, tries in batch:
+                    if tries + 1 < self._DB_WRITE_ATTEMPTS:
+                        self._db_write_q.put((user_id, file_info, tries + 1))
+                    else:
+                        logger.error("Giving up on storing temp file %s for user %s", file_info['file_id'], user_id)
                 continue
-            except Exception as e:
-                logger.error(f"Download worker error: {e}")
-                self.download_queue.task_done()
+            
+            # Written rows can now be read from the database, unless a newer version arrived meanwhile
+            with self._temp_lock:
+                for user_id, file_info, _ in batch:
+                    key = (user_id, file_info['file_id'])
+                    if self._temp_cache.get(key) is file_info:
+                        del self._temp_cache[key]
+    
+    def get_temp_file(self, user_id: int, file_id: str) -> Optional[Dict]:
+        """Get stored file info, including files still waiting to be written"""
+        with self._temp_lock:
+            file_info = self._temp_cache.get((user_id, file_id))
+        if file_info is not None:
+            return file_info
+        return self.db.get_temp_file(user_id, file_id)
     
     def handle_file_upload(self, message, file_type):
+        """Queue a file upload for its chat without blocking the calling handler thread"""
+        self._loop.call_soon_threadsafe(self._enqueue_upload, message, file_type)
+    
+    def _enqueue_upload(self, message, file_type):
+        """Add an upload to its chat's queue, starting the chat's worker if none is running"""
+        chat_id = message.chat.id
+        chat_queue = self._chat_queues.get(chat_id)
+        if chat_queue is None:
+            chat_queue = self._chat_queues[chat_id] = asyncio.Queue()
+        chat_queue.put_nowait((message, file_type))
+        self._pending_files += 1
+        
+        if chat_id not in self._chat_workers:
+            self._chat_workers[chat_id] = self._spawn(self._drain_chat(chat_id, chat_queue))
+    
+    async def _drain_chat(self, chat_id: int, chat_queue: asyncio.Queue):
+        """Handle one chat's uploads in arrival order, exiting once its queue is empty"""
+        carry = None  # Item read while collecting an album that belongs after it
+        try:
+            while carry or not chat_queue.empty():
+                message, file_type = carry or chat_queue.get_nowait()
+                carry = None
+                
+                group_id = message.media_group_id
+                if group_id is None:
+                    await self._upload_logged(message, file_type)
+                    self._pending_files -= 1
+                    continue
+                
+                # Collect the rest of the album, then handle its files concurrently
+                group = [(message, file_type)]
+                while True:
+                    try:
+                        item = await asyncio.wait_for(chat_queue.get(), self._MEDIA_GROUP_DEBOUNCE)
+                    except asyncio.TimeoutError:
+                        break
+                    if item[0].media_group_id != group_id:
+                        carry = item
+                        break
+                    group.append(item)
+                
+                await asyncio.gather(*(self._upload_album_part(m, kind) for m, kind in group))
+                self._pending_files -= len(group)
+        finally:
+            # No await since the last empty() check, so nothing can have been queued meanwhile
+            del self._chat_workers[chat_id]
+            del self._chat_queues[chat_id]
+    
+    async def _upload_album_part(self, message, file_type):
+        """Handle one file of an album once an album slot is free"""
+        async with self._album_sem:
+            await self._upload_logged(message, file_type)
+    
+    async def _upload_logged(self, message, file_type):
+        """Handle a file upload, logging anything it raises"""
+        try:
+            await self._handle_file_upload(message, file_type)
+        except Exception as e:
+            logger.error("Unhandled file manager error: %s", e)
+    
+    async def _handle_file_upload(self, message, file_type):
         """Handle file upload from user"""
+        user_id = message.from_user.id
+        chat_id = message.chat.id
+        
+        # Get file info based on type
+        file_info = self._get_file_info(message, file_type)
+        if not file_info:
+            return
+        
+        # Create file processing options keyboard
+        keyboard = self._build_file_kb(file_info['file_id'])
+        
+        # Send file options
+        text = _UPLOAD_TEMPLATE.format_map({
+            'name': file_info['name'],
+            'size': self._format_file_size(file_info['size']),
+            'type': file_info['type']
+        })
+        
+        # Store file info for later processing (written in the background)
+        with self._temp_lock:
+            self._temp_cache[(user_id, file_info['file_id'])] = file_info
+        self._db_write_q.put((user_id, file_info, 0))
+        
         try:
-            user_id = message.from_user.id
-            chat_id = message.chat.id
-            
-            # Get file info based on type
-            file_info = self._get_file_info(message, file_type)
-            if not file_info:
-                return
-            
-            # Create file processing options keyboard
-            keyboard = types.InlineKeyboardMarkup()
-            keyboard.row(
-                types.InlineKeyboardButton("✏️ Rename", callback_data=f"file_rename_{file_info['file_id']}"),
-                types.InlineKeyboardButton("🖼️ Thumbnail", callback_data=f"file_thumb_{file_info['file_id']}")
-            )
-            keyboard.row(
-                types.InlineKeyboardButton("📊 Metadata", callback_data=f"file_meta_{file_info['file_id']}"),
-                types.InlineKeyboardButton("💬 Caption", callback_data=f"file_caption_{file_info['file_id']}")
+            # telebot is blocking, keep it off the loop
+            await asyncio.to_thread(
+                self.bot.send_message,
+                chat_id=chat_id,
+                text=text,
+                parse_mode='Markdown',
+                reply_markup=keyboard
             )
-            keyboard.row(
-                types.InlineKeyboardButton("🔄 Add to Batch", callback_data=f"file_batch_{file_info['file_id']}"),
-                types.InlineKeyboardButton("⚡ Process Now", callback_data=f"file_process_{file_info['file_id']}")
-            )
-            
-            # Send file options
-            text = f"""
-📁 **File Received!**
-
-**File Details:**
-• Name: `{file_info['name']}`
-• Size: {self._format_file_size(file_info['size'])}
-• Type: {file_info['type']}
-
-**What would you like to do?**
-            """
-            
-            # Store file info for later processing
-            self.db.store_temp_file(user_id, file_info)
-            
-            # Send with bot instance from handlers
-            from bot.handlers import BotHandlers
-            bot = getattr(BotHandlers, '_current_bot', None)
-            if bot:
-                bot.send_message(
-                    chat_id=chat_id,
-                    text=text,
-                    parse_mode='Markdown',
-                    reply_markup=keyboard
-                )
             
         except Exception as e:
-            logger.error(f"Error handling file upload: {e}")
+            logger.error("Error handling file upload: %s", e)
     
-    def _get_file_info(self, message, file_type):
+    def _build_file_kb(self, file_id: str) -> types.InlineKeyboardMarkup:
+        """Build the file options keyboard without per-row validation"""
+        return types.InlineKeyboardMarkup(keyboard=[
+            [types.InlineKeyboardButton(title, callback_data=prefix + file_id) for title, prefix in row]
+            for row in _FILE_ACTIONS
+        ])
+    
+    @staticmethod
+    def _get_file_info(message, file_type):
         """Extract file information from message"""
         try:
-            file_obj = None
+            accessor = FileManager._FILE_ACCESSORS.get(file_type)
+            if not accessor:
+                return None
             
-            if file_type == 'document':
-                file_obj = message.document
-            elif file_type == 'photo':
-                file_obj = message.photo[-1]  # Highest resolution
-            elif file_type == 'video':
-                file_obj = message.video
-            elif file_type == 'audio':
-                file_obj = message.audio
-            elif file_type == 'voice':
-                file_obj = message.voice
-            elif file_type == 'video_note':
-                file_obj = message.video_note
-            elif file_type == 'animation':
-                file_obj = message.animation
-                
+            file_obj = accessor(message)
             if not file_obj:
                 return None
-                
+            
+            # One dict for all optional fields (not every file type has them)
+            attrs = vars(file_obj)
+            file_id = attrs['file_id']
             return {
-                'file_id': file_obj.file_id,
-                'name': getattr(file_obj, 'file_name', f"{file_type}_{file_obj.file_id[:8]}"),
-                'size': getattr(file_obj, 'file_size', 0),
+                'file_id': file_id,
+                'name': attrs.get('file_name', f"{file_type}_{file_id[:8]}"),
+                'size': attrs.get('file_size', 0),
                 'type': file_type,
-                'mime_type': getattr(file_obj, 'mime_type', 'unknown'),
+                'mime_type': attrs.get('mime_type', 'unknown'),
                 'message_id': message.message_id,
                 'caption': message.caption or ""
             }
             
         except Exception as e:
-            logger.error(f"Error extracting file info: {e}")
+            logger.error("Error extracting file info: %s", e)
             return None
     
-    def _format_file_size(self, size_bytes):
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def _format_file_size(size_bytes):
         """Format file size in human readable format"""
-        if size_bytes == 0:
+        if not size_bytes:
             return "Unknown"
-            
-        for unit in ['B', 'KB', 'MB', 'GB']:
-            if size_bytes < 1024.0:
-                return f"{size_bytes:.1f} {unit}"
-            size_bytes /= 1024.0
-        return f"{size_bytes:.1f} TB"
+        
+        # Unit index from the bit length: every 10 bits is one 1024 step
+        unit = min((int(size_bytes).bit_length() - 1) // 10, 4)
+        return f"{size_bytes / (1 << (10 * unit)):.1f} {_SIZE_UNITS[unit]}"
     
     def handle_file_callback(self, call):
         """Handle file-related callback queries"""
+        # partition keeps underscores inside the file_id intact
+        _, _, rest = call.data.partition('_')
+        action, _, file_id = rest.partition('_')
+        
+        handler = self._callback_dispatch.get(action)
+        if not handler:
+            return
+        
         try:
-            data_parts = call.data.split('_')
-            action = data_parts[1]
-            file_id = data_parts[2] if len(data_parts) > 2 else None
-            
-            if action == 'rename':
-                self._handle_rename_request(call, file_id)
-            elif action == 'thumb':
-                self._handle_thumbnail_request(call, file_id)
-            elif action == 'meta':
-                self._handle_metadata_request(call, file_id)
-            elif action == 'caption':
-                self._handle_caption_request(call, file_id)
-            elif action == 'batch':
-                self._handle_batch_request(call, file_id)
-            elif action == 'process':
-                self._handle_process_request(call, file_id)
-                
+            handler(call, file_id or None)
         except Exception as e:
-            logger.error(f"Error handling file callback: {e}")
+            logger.error("Error handling file callback: %s", e)
     
     def _handle_rename_request(self, call, file_id):
         """Handle rename request"""
@@ -230,22 +354,11 @@ class FileManager:
             user_id = call.from_user.id
             
             # Get stored file info
-            file_info = self.db.get_temp_file(user_id, file_id)
+            file_info = self.get_temp_file(user_id, file_id)
             if not file_info:
                 return
                 
-            text = f"""
-✏️ **Rename File**
-
-Current name: `{file_info['name']}`
-
-**Options:**
-1️⃣ Send new filename
-2️⃣ Use naming pattern
-3️⃣ Auto-rename with counter
-
-Send the new filename or choose an option:
-            """
+            text = _RENAME_TEMPLATE.format_map(file_info)
             
             keyboard = types.InlineKeyboardMarkup()
             keyboard.row(
@@ -257,19 +370,16 @@ Send the new filename or choose an option:
             )
             
             # Edit message
-            from bot.handlers import BotHandlers
-            bot = getattr(BotHandlers, '_current_bot', None)
-            if bot:
-                bot.edit_message_text(
-                    chat_id=call.message.chat.id,
-                    message_id=call.message.message_id,
-                    text=text,
-                    parse_mode='Markdown',
-                    reply_markup=keyboard
-                )
+            self.bot.edit_message_text(
+                chat_id=call.message.chat.id,
+                message_id=call.message.message_id,
+                text=text,
+                parse_mode='Markdown',
+                reply_markup=keyboard
+            )
                 
         except Exception as e:
-            logger.error(f"Error handling rename request: {e}")
+            logger.error("Error handling rename request: %s", e)
     
     def _handle_thumbnail_request(self, call, file_id):
         """Handle thumbnail request"""
@@ -293,44 +403,125 @@ Send the new filename or choose an option:
         """Handle immediate processing request"""
         pass
     
-    def _process_upload_task(self, task):
-        """Process an upload task"""
+    async def _process_upload_task(self, task):
+        """Process an upload task: {'user_id', 'chat_id', 'path', 'name', 'caption'}"""
         try:
-            # Implementation for processing upload tasks
-            pass
+            user_id = task['user_id']
+            self.active_uploads.add(user_id)
+            try:
+                # File open and send as one worker-thread call
+                await asyncio.to_thread(self._send_file, task)
+            finally:
+                self.active_uploads.discard(user_id)
+            
         except Exception as e:
-            logger.error(f"Error processing upload task: {e}")
+            logger.error("Error processing upload task: %s", e)
     
-    def _process_download_task(self, task):
-        """Process a download task"""
+    def _send_file(self, task: Dict):
+        """Send a local file as a document (runs in a worker thread)"""
+        with open(task['path'], 'rb') as f:
+            self.bot.send_document(
+                task['chat_id'],
+                f,
+                caption=task.get('caption') or None,
+                visible_file_name=task.get('name')
+            )
+    
+    async def _process_download_task(self, task):
+        """Process a download task: {'user_id', 'file_id', 'path'}"""
         try:
-            # Implementation for processing download tasks
-            pass
+            user_id = task['user_id']
+            self.active_downloads.add(user_id)
+            try:
+                file = await asyncio.to_thread(self.bot.get_file, task['file_id'])
+                url = (apihelper.FILE_URL or "https://api.telegram.org/file/bot{0}/{1}").format(self.bot.token, file.file_path)
+                await self._download_parallel(url, file.file_size or 0, task['path'])
+            finally:
+                self.active_downloads.discard(user_id)
+            
         except Exception as e:
-            logger.error(f"Error processing download task: {e}")
+            logger.error("Error processing download task: %s", e)
+    
+    async def _download_parallel(self, url: str, size: int, path: str):
+        """Download a file as concurrent byte ranges written in place"""
+        part = self.config.DOWNLOAD_PART_SIZE
+        sem = asyncio.Semaphore(self.config.DOWNLOAD_CONNECTIONS)
+        
+        async def fetch(offset: int, length: Optional[int]) -> bool:
+            async with sem:
+                return await asyncio.to_thread(self._download_range, url, fd, offset, length)
+        
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if not size:
+                # Unknown size - single plain request
+                await fetch(0, None)
+                return
+            
+            # Reserve the whole file up front so range writes don't fragment it
+            if hasattr(os, 'posix_fallocate'):
+                try:
+                    os.posix_fallocate(fd, 0, size)
+                except OSError:
+                    pass
+            
+            # Probe with the first range alone; a server that ignored Range has already sent everything
+            if not await fetch(0, min(part, size)):
+                return
+            
+            await asyncio.gather(*(fetch(offset, min(part, size - offset)) for offset in range(part, size, part)))
+        finally:
+            os.close(fd)
+    
+    def _download_range(self, url: str, fd: int, offset: int, length: Optional[int]) -> bool:
+        """Fetch one byte range and write it at its offset, returning whether Range was honoured (runs in a worker thread)"""
+        headers = {'Range': f"bytes={offset}-{offset + length - 1}"} if length else {}
+        response = self._http.get(url, headers=headers, timeout=60)
+        response.raise_for_status()
+        
+        # A server that ignores Range sends the whole file, which belongs at offset 0
+        ranged = response.status_code == 206
+        os.pwrite(fd, response.content, offset if ranged else 0)
+        return ranged
     
     def get_queue_status(self, user_id):
         """Get queue status for user"""
         try:
-            # Get user's files in queue
-            user_files = self.db.get_user_queue_files(user_id)
+            counts = self._get_queue_counts(user_id)
             
             return {
-                'count': len(user_files),
-                'processing': sum(1 for f in user_files if f['status'] == 'processing'),
-                'completed': sum(1 for f in user_files if f['status'] == 'completed'),
-                'failed': sum(1 for f in user_files if f['status'] == 'failed'),
+                'count': counts['total'],
+                'processing': counts['processing'],
+                'completed': counts['completed'],
+                'failed': counts['failed'],
                 'current_operations': self._get_current_operations_text(user_id),
-                'global_count': self.upload_queue.qsize() + self.download_queue.qsize(),
-                'workers': self.config.CONCURRENT_UPLOADS + self.config.CONCURRENT_DOWNLOADS,
+                'global_count': self._pending_files,
+                'workers': self._total_workers,
                 'avg_time': '2-5 seconds',
                 'success_rate': 99.9
             }
             
         except Exception as e:
-            logger.error(f"Error getting queue status: {e}")
+            logger.error("Error getting queue status: %s", e)
             return {}
     
+    def _get_queue_counts(self, user_id: int) -> Dict[str, int]:
+        """Get user's queue counts per status, cached for a short time"""
+        now = time.monotonic()
+        cached = self._queue_counts_cache.get(user_id)
+        if cached and now - cached[0] < self._QUEUE_COUNTS_TTL:
+            return cached[1]
+        
+        counts = self.db.get_user_queue_counts(user_id)
+        if len(self._queue_counts_cache) > 1000:
+            # Drop expired entries so the cache doesn't grow with every user ever seen
+            self._queue_counts_cache = {
+                uid: entry for uid, entry in self._queue_counts_cache.items()
+                if now - entry[0] < self._QUEUE_COUNTS_TTL
+            }
+        self._queue_counts_cache[user_id] = (now, counts)
+        return counts
+    
     def _get_current_operations_text(self, user_id):
         """Get current operations text for user"""
         try:
@@ -345,5 +536,5 @@ Send the new filename or choose an option:
             return "\n".join(operations) if operations else "No active operations"
             
         except Exception as e:
-            logger.error(f"Error getting operations text: {e}")
+            logger.error("Error getting operations text: %s", e)
             return "Status unavailable"
\ No newline at end of file
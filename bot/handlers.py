@@ -3,66 +3,66 @@ Main bot handlers for commands and messages
 Handles all user interactions and bot functionality using pyTelegramBotAPI
 """
 
+import html
+import io
 import logging
 import os
+import queue
+import re
+import threading
+import time
+from functools import cached_property, partial, wraps
 from typing import Dict, List, Any, Optional
 import telebot
 from telebot import types
+from cachetools import LRUCache, TTLCache
 
 from database import Database
 from config import Config
-from bot.file_manager import FileManager
-from bot.thumbnail_manager import ThumbnailManager
-from bot.broadcast import BroadcastManager
-from bot.subscription import SubscriptionManager
-from utils.patterns import PatternManager
 
 logger = logging.getLogger(__name__)
 
-class BotHandlers:
-    """Main handler class for all bot commands and messages"""
-    
-    # Class variable to store bot instance for other modules
-    _current_bot = None
-    
-    def __init__(self, database: Database, config: Config, bot: telebot.TeleBot):
-        self.db = database
-        self.config = config
-        self.bot = bot
-        # Store bot instance for other modules to access
-        BotHandlers._current_bot = bot
-        self.file_manager = FileManager(database, config)
-        self.thumbnail_manager = ThumbnailManager(database, config)
-        self.broadcast_manager = BroadcastManager(database, config)
-        self.subscription_manager = SubscriptionManager(database, config)
-        self.pattern_manager = PatternManager(database)
-        
-        # Track user states for multi-step operations
-        self.user_states = {}
-    
-    def start_command(self, message):
-        """Handle /start command with custom startup image"""
+_CODE_RE = re.compile(r'``\s?(.+?)\s?``|`([^`\n]+)`')
+_BOLD_RE = re.compile(r'\*\*(.+?)\*\*|\*([^*\n]+)\*')
+_ITALIC_RE = re.compile(r'(?<![\w/])_([^_\n]+)_(?!\w)')
+
+def _md_inline(text: str) -> str:
+    """Escape text and convert bold/italic markers to HTML tags"""
+    text = html.escape(text, quote=False)
+    text = _BOLD_RE.sub(lambda m: f"<b>{m.group(1) or m.group(2)}</b>", text)
+    return _ITALIC_RE.sub(r'<i>\1</i>', text)
+
+def _md_to_html(text: str) -> str:
+    """Convert the Markdown used in static texts to Telegram HTML"""
+    parts = []
+    pos = 0
+    for match in _CODE_RE.finditer(text):
+        parts.append(_md_inline(text[pos:match.start()]))
+        parts.append(f"<code>{html.escape(match.group(1) or match.group(2), quote=False)}</code>")
+        pos = match.end()
+    parts.append(_md_inline(text[pos:]))
+    return ''.join(parts)
+
+_ADMIN_ONLY_MSG = "❌ Admin access required."
+_GENERIC_ERR = "❌ An error occurred."
+
+def _safe_handler(fn):
+    """Log any error escaping a message handler and reply with the generic error"""
+    @wraps(fn)
+    def wrapper(self, message, *args, **kwargs):
         try:
-            user = message.from_user
-            chat_id = message.chat.id
-            
-            # Add user to database
-            self.db.add_user(
-                user_id=user.id,
-                username=user.username or "",
-                first_name=user.first_name or "",
-                last_name=user.last_name or ""
-            )
-            
-            # Check force subscription
-            if not self.subscription_manager.check_user_subscriptions(user.id):
-                return
-                
-            # Create welcome message
-            welcome_text = f"""
+            return fn(self, message, *args, **kwargs)
+        except Exception as e:
+            logger.error("Error in %s: %s", fn.__name__, e)
+            self._queue_error(message.chat.id, _GENERIC_ERR)
+    return wrapper
+
+# Static command texts, built once at import
+_WELCOME_PREFIX = """
 🎯 **Professional File Management Bot**
 
-👋 Welcome {user.first_name}!
+👋 Welcome """
+_WELCOME_SUFFIX = """!
 
 🚀 **Advanced Features:**
 • 📁 Any format file support
@@ -85,35 +85,10 @@ class BotHandlers:
 /stats - Usage statistics
 
 Ready to manage your files professionally! 💪
-            """
-            
-            # Send startup image if available
-            startup_image_path = "static/startup.png"
-            if os.path.exists(startup_image_path):
-                try:
-                    with open(startup_image_path, 'rb') as photo:
-                        self.bot.send_photo(
-                            chat_id=chat_id,
-                            photo=photo,
-                            caption=welcome_text,
-                            parse_mode='Markdown'
-                        )
-                except Exception as e:
-                    logger.error(f"Failed to send startup image: {e}")
-                    self.bot.send_message(chat_id=chat_id, text=welcome_text, parse_mode='Markdown')
-            else:
-                self.bot.send_message(chat_id=chat_id, text=welcome_text, parse_mode='Markdown')
-                
-            logger.info(f"New user started bot: {user.id}")
-            
-        except Exception as e:
-            logger.error(f"Error in start command: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ An error occurred. Please try again.")
-    
-    def help_command(self, message):
-        """Handle /help command"""
-        try:
-            help_text = """
+"""
+
+_TEXTS = {
+    'help': """
 🔧 **Bot Commands & Features**
 
 **📁 File Management:**
@@ -153,28 +128,8 @@ Ready to manage your files professionally! 💪
 ✅ Multi-admin support
 
 Need help with a specific feature? Just ask! 💬
-            """
-            
-            self.bot.send_message(
-                chat_id=message.chat.id,
-                text=help_text,
-                parse_mode='Markdown'
-            )
-            
-        except Exception as e:
-            logger.error(f"Error in help command: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ An error occurred.")
-    
-    def rename_command(self, message):
-        """Handle /rename command"""
-        try:
-            user_id = message.from_user.id
-            
-            # Check subscription
-            if not self.subscription_manager.check_user_subscriptions(user_id):
-                return
-                
-            text = """
+""",
+    'rename': """
 📝 **File Rename System**
 
 **How to rename files:**
@@ -199,28 +154,8 @@ Need help with a specific feature? Just ask! 💬
 ⚡ Lightning fast processing
 
 Send a file to start renaming! 📤
-            """
-            
-            self.bot.send_message(
-                chat_id=message.chat.id,
-                text=text,
-                parse_mode='Markdown'
-            )
-            
-        except Exception as e:
-            logger.error(f"Error in rename command: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ An error occurred.")
-    
-    def batch_rename_command(self, message):
-        """Handle /batch_rename command"""
-        try:
-            user_id = message.from_user.id
-            
-            # Check subscription
-            if not self.subscription_manager.check_user_subscriptions(user_id):
-                return
-                
-            text = """
+""",
+    'batch_rename': """
 🔄 **Batch Rename System**
 
 **Process multiple files at once:**
@@ -250,28 +185,8 @@ Send a file to start renaming! 📤
 → MyVideo_001_2024-08-24.mp4
 
 Start sending files for batch processing! 📦
-            """
-            
-            self.bot.send_message(
-                chat_id=message.chat.id,
-                text=text,
-                parse_mode='Markdown'
-            )
-            
-        except Exception as e:
-            logger.error(f"Error in batch_rename command: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ An error occurred.")
-    
-    def set_thumbnail_command(self, message):
-        """Handle /set_thumbnail command"""
-        try:
-            user_id = message.from_user.id
-            
-            # Check subscription
-            if not self.subscription_manager.check_user_subscriptions(user_id):
-                return
-                
-            text = """
+""",
+    'set_thumbnail': """
 🖼️ **Custom Thumbnail System**
 
 **How to set thumbnails:**
@@ -295,60 +210,8 @@ Start sending files for batch processing! 📦
 🔄 Update thumbnails anytime
 
 Send an image to set as thumbnail! 📸
-            """
-            
-            self.bot.send_message(
-                chat_id=message.chat.id,
-                text=text,
-                parse_mode='Markdown'
-            )
-            
-        except Exception as e:
-            logger.error(f"Error in set_thumbnail command: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ An error occurred.")
-    
-    def permanent_thumbnail_command(self, message):
-        """Handle /permanent_thumb command"""
-        try:
-            user_id = message.from_user.id
-            
-            # Check subscription
-            if not self.subscription_manager.check_user_subscriptions(user_id):
-                return
-                
-            # Toggle permanent thumbnail setting
-            current_setting = self.db.get_user_setting(user_id, 'permanent_thumbnail', False)
-            new_setting = not current_setting
-            self.db.set_user_setting(user_id, 'permanent_thumbnail', new_setting)
-            
-            status = "✅ Enabled" if new_setting else "❌ Disabled"
-            text = f"""
-🖼️ **Permanent Thumbnail Setting**
-
-Status: {status}
-
-**What this means:**
-{f"• All your files will automatically use your set thumbnail" if new_setting else "• Files will use their original thumbnails by default"}
-{f"• You can still override per file if needed" if new_setting else "• Send thumbnail with each file for custom thumbnail"}
-{f"• Saves time for batch operations" if new_setting else "• More control over individual files"}
-
-Use /set_thumbnail to choose your thumbnail image.
-            """
-            
-            self.bot.send_message(
-                chat_id=message.chat.id,
-                text=text,
-                parse_mode='Markdown'
-            )
-            
-        except Exception as e:
-            logger.error(f"Error in permanent_thumb command: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ An error occurred.")
-    
-    def metadata_command(self, message):
-        """Handle /metadata command"""
-        try:
-            text = """
+""",
+    'metadata': """
 📊 **Metadata Editor**
 
 **Edit file information:**
@@ -379,22 +242,8 @@ Use /set_thumbnail to choose your thumbnail image.
 5️⃣ Get file with updated metadata!
 
 Send a file to edit its metadata! 📝
-            """
-            
-            self.bot.send_message(
-                chat_id=message.chat.id,
-                text=text,
-                parse_mode='Markdown'
-            )
-            
-        except Exception as e:
-            logger.error(f"Error in metadata command: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ An error occurred.")
-    
-    def caption_command(self, message):
-        """Handle /caption command"""
-        try:
-            text = """
+""",
+    'caption': """
 💬 **Caption Editor**
 
 **Modify file captions:**
@@ -426,32 +275,8 @@ _Italic text_ - `_text_`
 5️⃣ Download with new caption!
 
 Ready to add amazing captions! ✨
-            """
-            
-            self.bot.send_message(
-                chat_id=message.chat.id,
-                text=text,
-                parse_mode='Markdown'
-            )
-            
-        except Exception as e:
-            logger.error(f"Error in caption command: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ An error occurred.")
-    
-    def broadcast_command(self, message):
-        """Handle /broadcast command"""
-        try:
-            user_id = message.from_user.id
-            
-            # Check if user is admin
-            if user_id not in self.config.ADMIN_IDS:
-                self.bot.send_message(
-                    chat_id=message.chat.id,
-                    text="❌ This command is only available to administrators."
-                )
-                return
-                
-            text = """
+""",
+    'broadcast': """
 📢 **Broadcast System**
 
 **Send messages to all users:**
@@ -477,208 +302,31 @@ Ready to add amazing captions! ✨
 🔗 Links & buttons
 
 Reply with your broadcast message! 📡
-            """
-            
-            self.bot.send_message(
-                chat_id=message.chat.id,
-                text=text,
-                parse_mode='Markdown'
-            )
-            
-            # Set user state for broadcast
-            self.user_states[user_id] = 'awaiting_broadcast'
-            
-        except Exception as e:
-            logger.error(f"Error in broadcast command: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ An error occurred.")
-    
-    def stats_command(self, message):
-        """Handle /stats command"""
-        try:
-            user_id = message.from_user.id
-            
-            # Get user statistics
-            user_stats = self.db.get_user_stats(user_id)
-            total_users = self.db.get_total_users()
-            
-            # Admin gets global stats
-            if user_id in self.config.ADMIN_IDS:
-                stats_text = f"""
-📊 **Global Bot Statistics**
-
-👥 **Users:** {total_users}
-📁 **Total Files Processed:** {user_stats.get('total_files', 0)}
-🔄 **Rename Operations:** {user_stats.get('renames', 0)}
-🖼️ **Thumbnails Set:** {user_stats.get('thumbnails', 0)}
-📢 **Broadcasts Sent:** {user_stats.get('broadcasts', 0)}
+""",
+    'auto_rename': """
+🤖 **Auto-Rename System**
 
-⚡ **Performance:**
-• Average processing: <2 seconds
-• Uptime: 99.9%
-• Queue capacity: Unlimited
-• Error rate: <0.1%
+**Set patterns for automatic file renaming:**
 
-🔧 **System Health:**
-• Database: ✅ Online
-• File Storage: ✅ Available  
-• Monitoring: ✅ Active
-• Auto-recovery: ✅ Enabled
-                """
-            else:
-                stats_text = f"""
-📊 **Your Statistics**
+**Available Variables:**
+• `{counter}` - Sequential number (001, 002...)
+• `{date}` - Current date (2024-08-24)
+• `{time}` - Current time (14:30:25)
+• `{original}` - Original filename
+• `{user}` - Your username  
+• `{ext}` - File extension
+• `{size}` - File size
+• `{type}` - File type
 
-📁 **Files Processed:** {user_stats.get('files_processed', 0)}
-🔄 **Rename Operations:** {user_stats.get('renames', 0)}  
-🖼️ **Thumbnails Set:** {user_stats.get('thumbnails', 0)}
-📝 **Metadata Edits:** {user_stats.get('metadata_edits', 0)}
+**Example Patterns:**
+📁 `{user}_{counter}_{date}.{ext}`
+→ john_001_2024-08-24.mp4
 
-⏱️ **Activity:**
-• First used: {user_stats.get('first_used', 'Recently')}
-• Last active: {user_stats.get('last_active', 'Now')}
-• Total commands: {user_stats.get('commands', 0)}
+🎬 `Movie_{original}_{date}.{ext}`  
+→ Movie_avatar_2024-08-24.mkv
 
-🎯 **Efficiency:**
-• Success rate: {user_stats.get('success_rate', 100)}%
-• Avg processing: <2s
-• Storage used: {user_stats.get('storage_used', '0 MB')}
-                """
-            
-            self.bot.send_message(
-                chat_id=message.chat.id,
-                text=stats_text,
-                parse_mode='Markdown'
-            )
-            
-        except Exception as e:
-            logger.error(f"Error in stats command: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ An error occurred.")
-    
-    def logs_command(self, message):
-        """Handle /logs command"""
-        try:
-            user_id = message.from_user.id
-            
-            # Check if user is admin
-            if user_id not in self.config.ADMIN_IDS:
-                self.bot.send_message(
-                    chat_id=message.chat.id,
-                    text="❌ This command is only available to administrators."
-                )
-                return
-                
-            # Get recent logs
-            try:
-                if os.path.exists('bot.log'):
-                    with open('bot.log', 'r') as f:
-                        lines = f.readlines()
-                        recent_logs = ''.join(lines[-50:])  # Last 50 lines
-                        
-                    if len(recent_logs) > 4000:  # Telegram message limit
-                        recent_logs = recent_logs[-4000:]
-                        
-                    log_text = f"📋 **Recent Bot Logs**\n\n```\n{recent_logs}\n```"
-                else:
-                    log_text = "📋 **Recent Bot Logs**\n\nNo log file found."
-                    
-            except Exception as e:
-                log_text = f"📋 **Recent Bot Logs**\n\nError reading logs: {e}"
-            
-            self.bot.send_message(
-                chat_id=message.chat.id,
-                text=log_text,
-                parse_mode='Markdown'
-            )
-            
-        except Exception as e:
-            logger.error(f"Error in logs command: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ An error occurred.")
-    
-    def settings_command(self, message):
-        """Handle /settings command"""
-        try:
-            user_id = message.from_user.id
-            
-            # Get user settings
-            settings = self.db.get_user_settings(user_id)
-            
-            settings_text = f"""
-⚙️ **Bot Settings**
-
-🖼️ **Thumbnail:**
-• Permanent Thumbnail: {'✅' if settings.get('permanent_thumbnail') else '❌'}
-• Auto Thumbnails: {'✅' if settings.get('auto_thumbnails', True) else '❌'}
-
-🔄 **Auto-Rename:**
-• Pattern: {settings.get('rename_pattern', 'None set')}
-• Auto Counter: {'✅' if settings.get('auto_counter', True) else '❌'}
-• Date Format: {settings.get('date_format', '%Y-%m-%d')}
-
-📊 **Quality:**
-• Video Quality: {settings.get('video_quality', 'Original')}
-• Audio Bitrate: {settings.get('audio_bitrate', 'Original')}
-• Compression: {'✅' if settings.get('compression') else '❌'}
-
-🔔 **Notifications:**
-• Process Complete: {'✅' if settings.get('notify_complete', True) else '❌'}
-• Errors: {'✅' if settings.get('notify_errors', True) else '❌'}
-• Updates: {'✅' if settings.get('notify_updates', True) else '❌'}
-
-Use the buttons below to modify settings:
-            """
-            
-            # Create settings keyboard
-            keyboard = types.InlineKeyboardMarkup()
-            keyboard.row(
-                types.InlineKeyboardButton("🖼️ Thumbnail", callback_data="settings_thumbnail"),
-                types.InlineKeyboardButton("🔄 Auto-Rename", callback_data="settings_rename")
-            )
-            keyboard.row(
-                types.InlineKeyboardButton("📊 Quality", callback_data="settings_quality"),
-                types.InlineKeyboardButton("🔔 Notifications", callback_data="settings_notifications")
-            )
-            keyboard.row(
-                types.InlineKeyboardButton("🔄 Reset All", callback_data="settings_reset")
-            )
-            
-            self.bot.send_message(
-                chat_id=message.chat.id,
-                text=settings_text,
-                parse_mode='Markdown',
-                reply_markup=keyboard
-            )
-            
-        except Exception as e:
-            logger.error(f"Error in settings command: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ An error occurred.")
-    
-    def auto_rename_command(self, message):
-        """Handle /auto_rename command"""
-        try:
-            text = """
-🤖 **Auto-Rename System**
-
-**Set patterns for automatic file renaming:**
-
-**Available Variables:**
-• `{counter}` - Sequential number (001, 002...)
-• `{date}` - Current date (2024-08-24)
-• `{time}` - Current time (14:30:25)
-• `{original}` - Original filename
-• `{user}` - Your username  
-• `{ext}` - File extension
-• `{size}` - File size
-• `{type}` - File type
-
-**Example Patterns:**
-📁 `{user}_{counter}_{date}.{ext}`
-→ john_001_2024-08-24.mp4
-
-🎬 `Movie_{original}_{date}.{ext}`  
-→ Movie_avatar_2024-08-24.mkv
-
-📊 `Report_{counter}_{time}.{ext}`
-→ Report_001_14-30-25.pdf
+📊 `Report_{counter}_{time}.{ext}`
+→ Report_001_14-30-25.pdf
 
 **Features:**
 • Auto-increment counters
@@ -688,38 +336,8 @@ Use the buttons below to modify settings:
 • Pattern templates
 
 Send pattern or use /pattern for templates! 🎯
-            """
-            
-            self.bot.send_message(
-                chat_id=message.chat.id,
-                text=text,
-                parse_mode='Markdown'
-            )
-            
-            # Set user state for pattern input
-            self.user_states[message.from_user.id] = 'awaiting_pattern'
-            
-        except Exception as e:
-            logger.error(f"Error in auto_rename command: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ An error occurred.")
-    
-    def pattern_command(self, message):
-        """Handle /pattern command"""
-        try:
-            user_id = message.from_user.id
-            
-            # Get saved patterns
-            patterns = self.pattern_manager.get_user_patterns(user_id)
-            
-            text = "🎯 **Naming Pattern Templates**\n\n"
-            
-            if patterns:
-                text += "**Your Saved Patterns:**\n"
-                for i, pattern in enumerate(patterns, 1):
-                    text += f"{i}. `{pattern['pattern']}` - {pattern['description']}\n"
-                text += "\n"
-            
-            text += """
+""",
+    'pattern_templates': """
 **Quick Templates:**
 1️⃣ `{user}_{counter}_{date}.{ext}` - User files
 2️⃣ `{date}_{original}.{ext}` - Date prefix  
@@ -735,155 +353,8 @@ Send pattern or use /pattern for templates! 🎯
 • `{user:upper}` - Uppercase
 
 Click a number to use template or send custom pattern! 🎨
-            """
-            
-            # Create pattern keyboard
-            keyboard = types.InlineKeyboardMarkup()
-            keyboard.row(
-                types.InlineKeyboardButton("1", callback_data="pattern_1"),
-                types.InlineKeyboardButton("2", callback_data="pattern_2"),
-                types.InlineKeyboardButton("3", callback_data="pattern_3")
-            )
-            keyboard.row(
-                types.InlineKeyboardButton("4", callback_data="pattern_4"),
-                types.InlineKeyboardButton("5", callback_data="pattern_5")
-            )
-            
-            self.bot.send_message(
-                chat_id=message.chat.id,
-                text=text,
-                parse_mode='Markdown',
-                reply_markup=keyboard
-            )
-            
-        except Exception as e:
-            logger.error(f"Error in pattern command: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ An error occurred.")
-    
-    def queue_command(self, message):
-        """Handle /queue command"""
-        try:
-            user_id = message.from_user.id
-            
-            # Get queue status
-            queue_info = self.file_manager.get_queue_status(user_id)
-            
-            text = f"""
-📋 **Processing Queue Status**
-
-**Your Queue:**
-• Files in queue: {queue_info.get('count', 0)}
-• Processing: {queue_info.get('processing', 0)}
-• Completed: {queue_info.get('completed', 0)}
-• Failed: {queue_info.get('failed', 0)}
-
-**Current Operations:**
-{queue_info.get('current_operations', 'No active operations')}
-
-**Global Queue:**
-• Total files: {queue_info.get('global_count', 0)}
-• Active workers: {queue_info.get('workers', 0)}
-• Avg processing time: {queue_info.get('avg_time', 'N/A')}
-
-**Performance:**
-• Success rate: {queue_info.get('success_rate', 100)}%
-• Queue capacity: Unlimited
-• Max concurrent: 10 files/user
-
-🔄 Files are processed in order. Large files may take longer.
-            """
-            
-            # Create queue management keyboard
-            keyboard = types.InlineKeyboardMarkup()
-            if queue_info.get('count', 0) > 0:
-                keyboard.row(
-                    types.InlineKeyboardButton("🔄 Refresh", callback_data="queue_refresh"),
-                    types.InlineKeyboardButton("❌ Clear Queue", callback_data="queue_clear")
-                )
-            else:
-                keyboard.row(
-                    types.InlineKeyboardButton("🔄 Refresh", callback_data="queue_refresh")
-                )
-            
-            self.bot.send_message(
-                chat_id=message.chat.id,
-                text=text,
-                parse_mode='Markdown',
-                reply_markup=keyboard
-            )
-            
-        except Exception as e:
-            logger.error(f"Error in queue command: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ An error occurred.")
-    
-    # Admin commands
-    def force_subscribe_command(self, message):
-        """Handle /force_sub command"""
-        try:
-            user_id = message.from_user.id
-            
-            if user_id not in self.config.ADMIN_IDS:
-                self.bot.send_message(
-                    chat_id=message.chat.id,
-                    text="❌ Admin access required."
-                )
-                return
-                
-            self.subscription_manager.handle_force_subscribe_setup(message)
-            
-        except Exception as e:
-            logger.error(f"Error in force_sub command: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ An error occurred.")
-    
-    def add_channel_command(self, message):
-        """Handle /add_channel command"""
-        try:
-            user_id = message.from_user.id
-            
-            if user_id not in self.config.ADMIN_IDS:
-                self.bot.send_message(
-                    chat_id=message.chat.id,
-                    text="❌ Admin access required."
-                )
-                return
-                
-            self.subscription_manager.handle_add_channel(message)
-            
-        except Exception as e:
-            logger.error(f"Error in add_channel command: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ An error occurred.")
-    
-    def remove_channel_command(self, message):
-        """Handle /remove_channel command"""
-        try:
-            user_id = message.from_user.id
-            
-            if user_id not in self.config.ADMIN_IDS:
-                self.bot.send_message(
-                    chat_id=message.chat.id,
-                    text="❌ Admin access required."
-                )
-                return
-                
-            self.subscription_manager.handle_remove_channel(message)
-            
-        except Exception as e:
-            logger.error(f"Error in remove_channel command: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ An error occurred.")
-    
-    def set_log_channel_command(self, message):
-        """Handle /set_log_channel command"""
-        try:
-            user_id = message.from_user.id
-            
-            if user_id not in self.config.ADMIN_IDS:
-                self.bot.send_message(
-                    chat_id=message.chat.id,
-                    text="❌ Admin access required."
-                )
-                return
-                
-            text = """
+""",
+    'set_log_channel': """
 📝 **Set Log Channel**
 
 Send me the channel username or ID where you want to receive bot logs.
@@ -900,33 +371,8 @@ Send me the channel username or ID where you want to receive bot logs.
 • Admin notifications
 
 Reply with channel details! 📡
-            """
-            
-            self.bot.send_message(
-                chat_id=message.chat.id,
-                text=text,
-                parse_mode='Markdown'
-            )
-            
-            self.user_states[user_id] = 'awaiting_log_channel'
-            
-        except Exception as e:
-            logger.error(f"Error in set_log_channel command: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ An error occurred.")
-    
-    def set_storage_command(self, message):
-        """Handle /set_storage command"""
-        try:
-            user_id = message.from_user.id
-            
-            if user_id not in self.config.ADMIN_IDS:
-                self.bot.send_message(
-                    chat_id=message.chat.id,
-                    text="❌ Admin access required."
-                )
-                return
-                
-            text = """
+""",
+    'set_storage': """
 💾 **Storage Configuration**
 
 **Current Storage Settings:**
@@ -945,189 +391,807 @@ Reply with channel details! 📡
 Set a channel for file backups and permanent storage.
 
 Send storage channel details! 🗄️
-            """
+"""
+}
+
+# Converted once so sends can use parse_mode='HTML' without runtime escaping
+_TEXTS = {key: _md_to_html(text) for key, text in _TEXTS.items()}
+_WELCOME_PREFIX = _md_to_html(_WELCOME_PREFIX)
+_WELCOME_SUFFIX = _md_to_html(_WELCOME_SUFFIX)
+
+_TEXT_HINT = "💡 Send me a file to start processing, or use /help to see all commands!"
+_PATTERN_SET_PREFIX = "✅ Pattern set: <code>"
+_PATTERN_SET_SUFFIX = "</code>\n\nYour files will now be renamed using this pattern!"
+
+_ESC = re.compile(r'[<>&]')
+_ESC_MAP = {'<': '&lt;', '>': '&gt;', '&': '&amp;'}
+
+def _keyboard(*rows) -> types.InlineKeyboardMarkup:
+    """Build an inline keyboard from rows of (label, callback_data) pairs"""
+    keyboard = types.InlineKeyboardMarkup()
+    for row in rows:
+        keyboard.row(*(types.InlineKeyboardButton(label, callback_data=data) for label, data in row))
+    return keyboard
+
+# Static keyboards are built once and shared by every send
+_SETTINGS_KEYBOARD = _keyboard(
+    (("🖼️ Thumbnail", "settings_thumbnail"), ("🔄 Auto-Rename", "settings_rename")),
+    (("📊 Quality", "settings_quality"), ("🔔 Notifications", "settings_notifications")),
+    (("🔄 Reset All", "settings_reset"),)
+)
+_PATTERN_KEYBOARD = _keyboard(
+    (("1", "pattern_1"), ("2", "pattern_2"), ("3", "pattern_3")),
+    (("4", "pattern_4"), ("5", "pattern_5"))
+)
+_QUEUE_KEYBOARD_WITH_CLEAR = _keyboard(
+    (("🔄 Refresh", "queue_refresh"), ("❌ Clear Queue", "queue_clear")),
+)
+_QUEUE_KEYBOARD_EMPTY = _keyboard(
+    (("🔄 Refresh", "queue_refresh"),)
+)
+
+class BotHandlers:
+    """Main handler class for all bot commands and messages"""
+    
+    # Class variable to store bot instance for other modules
+    _current_bot = None
+    
+    # Upload kinds; each gets a handle_<kind> method bound to _handle_file
+    _FILE_KINDS = ('document', 'photo', 'video', 'audio', 'voice', 'video_note', 'animation')
+    
+    def __init__(self, database: Database, config: Config, bot: telebot.TeleBot):
+        self.db = database
+        self.config = config
+        self.bot = bot
+        # Store bot instance for other modules to access
+        BotHandlers._current_bot = bot
+        
+        for kind in self._FILE_KINDS:
+            setattr(self, f'handle_{kind}', partial(self._handle_file, kind))
+        
+        # <prefix>_... callback dispatch; lambdas keep the managers lazy
+        self._cb_dispatch = {
+            'settings': self._handle_settings_callback,
+            'pattern': self._handle_pattern_callback,
+            'queue': self._handle_queue_callback,
+            'file': lambda call: self.file_manager.handle_file_callback(call),
+            'thumb': lambda call: self.thumbnail_manager.handle_thumbnail_callback(call),
+            'broadcast': lambda call: self.broadcast_manager.handle_broadcast_callback(call),
+            'sub': self._handle_sub_callback
+        }
+        
+        # /start user rows are written in batches by a background thread
+        self._user_write_q = queue.Queue()
+        threading.Thread(target=self._user_writer, daemon=True, name="UserWriter").start()
+        
+        # Error replies, with repeats to the same chat collapsed into one send
+        self._err_q = queue.Queue()
+        threading.Thread(target=self._error_sender, daemon=True, name="ErrorSender").start()
+        
+        # Managers are built on first use; the lock keeps concurrent handlers from building one twice
+        self._manager_lock = threading.Lock()
+        
+        # Telegram file_id of the startup image once it has been uploaded
+        self._startup_file_id = None
+        
+        # Admin lookups happen on every privileged command
+        self._admin_ids = frozenset(config.ADMIN_IDS)
+        
+        # Users who recently passed the force-subscribe check
+        self._sub_cache = TTLCache(maxsize=50_000, ttl=60)
+        
+        # cachetools caches are not thread-safe and handlers run on a worker pool
+        self._cache_lock = threading.Lock()
+        
+        # Per-user settings (invalidated on write) and short-lived stats
+        self._settings_cache = LRUCache(maxsize=10_000)
+        self._stats_cache = TTLCache(maxsize=10_000, ttl=10)
+        self._admin_stats_cache: Optional[tuple] = None  # (monotonic time, rendered text)
+        
+        # Track user states for multi-step operations; abandoned flows expire after 15 minutes
+        self.user_states = TTLCache(maxsize=100_000, ttl=900)
+    
+    def _user_writer(self):
+        """Persist queued /start users in batches of up to 32 rows or 50 ms"""
+        while True:
+            batch = [self._user_write_q.get()]
+            deadline = time.monotonic() + 0.05
+            while len(batch) < 32:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._user_write_q.get(timeout=timeout))
+                except queue.Empty:
+                    break
             
-            self.bot.send_message(
-                chat_id=message.chat.id,
-                text=text,
-                parse_mode='Markdown'
-            )
+            self.db.add_users_bulk(batch)
+    
+    def _queue_error(self, chat_id: int, text: str):
+        """Queue an error reply for the chat"""
+        self._err_q.put_nowait((chat_id, text))
+    
+    def _error_sender(self):
+        """Send queued error replies, one per distinct (chat, text) every 500 ms"""
+        while True:
+            pending = {self._err_q.get(): None}
+            deadline = time.monotonic() + 0.5
+            while True:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    pending[self._err_q.get(timeout=timeout)] = None
+                except queue.Empty:
+                    break
             
-            self.user_states[user_id] = 'awaiting_storage_channel'
+            for chat_id, text in pending:
+                try:
+                    self.bot.send_message(chat_id=chat_id, text=text)
+                except Exception as e:
+                    logger.error("Failed to send error reply to %s: %s", chat_id, e)
+    
+    def _build_once(self, name: str, factory):
+        """Construct a manager exactly once, even when handler threads race for it"""
+        with self._manager_lock:
+            if name not in self.__dict__:
+                self.__dict__[name] = factory()
+            return self.__dict__[name]
+    
+    @cached_property
+    def file_manager(self):
+        from bot.file_manager import FileManager
+        return self._build_once('file_manager', lambda: FileManager(self.db, self.config, self.bot))
+    
+    @cached_property
+    def thumbnail_manager(self):
+        from bot.thumbnail_manager import ThumbnailManager
+        return self._build_once('thumbnail_manager', lambda: ThumbnailManager(self.db, self.config))
+    
+    @cached_property
+    def broadcast_manager(self):
+        from bot.broadcast import BroadcastManager
+        return self._build_once('broadcast_manager', lambda: BroadcastManager(self.db, self.config))
+    
+    @cached_property
+    def subscription_manager(self):
+        from bot.subscription import SubscriptionManager
+        return self._build_once('subscription_manager', lambda: SubscriptionManager(self.db, self.config))
+    
+    @cached_property
+    def pattern_manager(self):
+        from utils.patterns import PatternManager
+        return self._build_once('pattern_manager', lambda: PatternManager(self.db))
+    
+    def _require_admin(self, message) -> bool:
+        """Return True for admins, otherwise tell the user and return False"""
+        if message.from_user.id in self._admin_ids:
+            return True
+        
+        self._deny_admin(message)
+        return False
+    
+    def _deny_admin(self, message):
+        """Send the admin-only rejection"""
+        self.bot.send_message(chat_id=message.chat.id, text=_ADMIN_ONLY_MSG)
+    
+    @property
+    def _force_sub_enabled(self) -> bool:
+        """Whether any force-subscribe channels are configured"""
+        # Read live: channels are added and removed in place on the config list
+        return bool(self.config.FORCE_SUB_CHANNELS)
+    
+    def _check_sub_cached(self, user_id: int) -> bool:
+        """Check force subscription, skipping the lookup for recently verified users"""
+        if not self._force_sub_enabled:
+            return True
+        
+        with self._cache_lock:
+            if self._sub_cache.get(user_id):
+                return True
+        
+        # The lookup may hit Telegram, so it runs outside the lock
+        subscribed = self.subscription_manager.check_user_subscriptions(user_id, self.bot)
+        # Only successes are cached so unsubscribed users keep getting the join prompt
+        if subscribed:
+            with self._cache_lock:
+                self._sub_cache[user_id] = True
+        return subscribed
+    
+    def _set_state(self, user_id: int, state: str):
+        """Record the multi-step flow a user is in"""
+        with self._cache_lock:
+            self.user_states[user_id] = state
+    
+    def _invalidate_sub(self, user_id: Optional[int] = None):
+        """Forget cached subscription results for one user, or for everyone"""
+        with self._cache_lock:
+            if user_id is None:
+                self._sub_cache.clear()
+            else:
+                self._sub_cache.pop(user_id, None)
+    
+    def _cached_settings(self, user_id: int) -> Dict[str, Any]:
+        """Get user settings, reading the database only on a cache miss"""
+        with self._cache_lock:
+            settings = self._settings_cache.get(user_id)
+        if settings is None:
+            settings = self.db.get_user_preferences(user_id)
+            with self._cache_lock:
+                self._settings_cache[user_id] = settings
+        return settings
+    
+    def _cached_stats(self, user_id: int) -> Dict[str, Any]:
+        """Get user statistics and total users, refreshed at most every 10 seconds"""
+        with self._cache_lock:
+            stats = self._stats_cache.get(user_id)
+        if stats is None:
+            stats = self.db.get_stats_bundle(user_id)
+            with self._cache_lock:
+                self._stats_cache[user_id] = stats
+        return stats
+    
+    @_safe_handler
+    def start_command(self, message):
+        """Handle /start command with custom startup image"""
+        user = message.from_user
+        chat_id = message.chat.id
+        
+        # Add user to database (written behind by _user_writer)
+        self._user_write_q.put_nowait((
+            user.id,
+            user.username or "",
+            user.first_name or "",
+            user.last_name or ""
+        ))
+        
+        # Check force subscription
+        if not self._check_sub_cached(user.id):
+            return
+            
+        # Create welcome message
+        # Only the user-supplied name needs escaping; the template is already HTML
+        safe_name = _ESC.sub(lambda m: _ESC_MAP[m.group(0)], user.first_name or "")
+        welcome_text = _WELCOME_PREFIX + safe_name + _WELCOME_SUFFIX
+        
+        # Send startup image if available
+        startup_image_path = "static/startup.png"
+        if self._startup_file_id or os.path.exists(startup_image_path):
+            try:
+                if self._startup_file_id:
+                    self.bot.send_photo(
+                        chat_id=chat_id,
+                        photo=self._startup_file_id,
+                        caption=welcome_text,
+                        parse_mode='HTML'
+                    )
+                else:
+                    with open(startup_image_path, 'rb') as photo:
+                        sent = self.bot.send_photo(
+                            chat_id=chat_id,
+                            photo=photo,
+                            caption=welcome_text,
+                            parse_mode='HTML'
+                        )
+                    # Later /start calls reference the stored copy instead of re-uploading
+                    self._startup_file_id = sent.photo[-1].file_id
+            except Exception as e:
+                logger.error("Failed to send startup image: %s", e)
+                self.bot.send_message(chat_id=chat_id, text=welcome_text, parse_mode='HTML')
+        else:
+            self.bot.send_message(chat_id=chat_id, text=welcome_text, parse_mode='HTML')
             
-        except Exception as e:
-            logger.error(f"Error in set_storage command: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ An error occurred.")
+        logger.info("New user started bot: %s", user.id)
     
-    # File handlers
-    def handle_document(self, message):
-        """Handle document uploads"""
-        try:
-            user_id = message.from_user.id
+    @_safe_handler
+    def help_command(self, message):
+        """Handle /help command"""
+        help_text = _TEXTS['help']
+        
+        self.bot.send_message(
+            chat_id=message.chat.id,
+            text=help_text,
+            parse_mode='HTML'
+        )
+    
+    @_safe_handler
+    def rename_command(self, message):
+        """Handle /rename command"""
+        user_id = message.from_user.id
+        
+        # Check subscription
+        if not self._check_sub_cached(user_id):
+            return
             
-            # Check subscription
-            if not self.subscription_manager.check_user_subscriptions(user_id):
-                return
-                
-            self.file_manager.handle_file_upload(message, 'document')
+        text = _TEXTS['rename']
+        
+        self.bot.send_message(
+            chat_id=message.chat.id,
+            text=text,
+            parse_mode='HTML'
+        )
+    
+    @_safe_handler
+    def batch_rename_command(self, message):
+        """Handle /batch_rename command"""
+        user_id = message.from_user.id
+        
+        # Check subscription
+        if not self._check_sub_cached(user_id):
+            return
             
-        except Exception as e:
-            logger.error(f"Error handling document: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ Error processing document.")
+        text = _TEXTS['batch_rename']
+        
+        self.bot.send_message(
+            chat_id=message.chat.id,
+            text=text,
+            parse_mode='HTML'
+        )
     
-    def handle_photo(self, message):
-        """Handle photo uploads"""
-        try:
-            user_id = message.from_user.id
+    @_safe_handler
+    def set_thumbnail_command(self, message):
+        """Handle /set_thumbnail command"""
+        user_id = message.from_user.id
+        
+        # Check subscription
+        if not self._check_sub_cached(user_id):
+            return
             
-            # Check subscription
-            if not self.subscription_manager.check_user_subscriptions(user_id):
-                return
-                
-            self.file_manager.handle_file_upload(message, 'photo')
+        text = _TEXTS['set_thumbnail']
+        
+        self.bot.send_message(
+            chat_id=message.chat.id,
+            text=text,
+            parse_mode='HTML'
+        )
+    
+    @_safe_handler
+    def permanent_thumbnail_command(self, message):
+        """Handle /permanent_thumb command"""
+        user_id = message.from_user.id
+        
+        # Check subscription
+        if not self._check_sub_cached(user_id):
+            return
+            
+        # Toggle permanent thumbnail setting
+        current_setting = self._cached_settings(user_id).get('permanent_thumbnail', False)
+        new_setting = not current_setting
+        self.db.set_user_preference(user_id, 'permanent_thumbnail', new_setting)
+        with self._cache_lock:
+            self._settings_cache.pop(user_id, None)
+        
+        status = "✅ Enabled" if new_setting else "❌ Disabled"
+        text = f"""
+🖼️ **Permanent Thumbnail Setting**
+
+Status: {status}
+
+**What this means:**
+{f"• All your files will automatically use your set thumbnail" if new_setting else "• Files will use their original thumbnails by default"}
+{f"• You can still override per file if needed" if new_setting else "• Send thumbnail with each file for custom thumbnail"}
+{f"• Saves time for batch operations" if new_setting else "• More control over individual files"}
+
+Use /set_thumbnail to choose your thumbnail image.
+            """
+        
+        self.bot.send_message(
+            chat_id=message.chat.id,
+            text=text,
+            parse_mode='Markdown'
+        )
+    
+    @_safe_handler
+    def metadata_command(self, message):
+        """Handle /metadata command"""
+        text = _TEXTS['metadata']
+        
+        self.bot.send_message(
+            chat_id=message.chat.id,
+            text=text,
+            parse_mode='HTML'
+        )
+    
+    @_safe_handler
+    def caption_command(self, message):
+        """Handle /caption command"""
+        text = _TEXTS['caption']
+        
+        self.bot.send_message(
+            chat_id=message.chat.id,
+            text=text,
+            parse_mode='HTML'
+        )
+    
+    @_safe_handler
+    def broadcast_command(self, message):
+        """Handle /broadcast command"""
+        user_id = message.from_user.id
+        
+        if not self._require_admin(message):
+            return
             
-        except Exception as e:
-            logger.error(f"Error handling photo: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ Error processing photo.")
+        text = _TEXTS['broadcast']
+        
+        self.bot.send_message(
+            chat_id=message.chat.id,
+            text=text,
+            parse_mode='HTML'
+        )
+        
+        # Set user state for broadcast
+        self._set_state(user_id, 'awaiting_broadcast')
     
-    def handle_video(self, message):
-        """Handle video uploads"""
-        try:
-            user_id = message.from_user.id
+    @_safe_handler
+    def stats_command(self, message):
+        """Handle /stats command"""
+        user_id = message.from_user.id
+        is_admin = user_id in self._admin_ids
+        now = time.monotonic()
+        
+        # Admins share one rendering of the global view for 5 seconds
+        cached = self._admin_stats_cache
+        admin_cached = is_admin and cached is not None and now - cached[0] < 5
+        
+        if not admin_cached:
+            # Get user statistics and user count in one round-trip
+            bundle = self._cached_stats(user_id)
+            user_stats = bundle['user']
+            total_users = bundle['total']
+        
+        if admin_cached:
+            stats_text = cached[1]
+        elif is_admin:
+            # Admin gets global stats
+            stats_text = f"""
+📊 **Global Bot Statistics**
+
+👥 **Users:** {total_users}
+📁 **Total Files Processed:** {user_stats.get('total_files', 0)}
+🔄 **Rename Operations:** {user_stats.get('renames', 0)}
+🖼️ **Thumbnails Set:** {user_stats.get('thumbnails', 0)}
+📢 **Broadcasts Sent:** {user_stats.get('broadcasts', 0)}
+
+⚡ **Performance:**
+• Average processing: <2 seconds
+• Uptime: 99.9%
+• Queue capacity: Unlimited
+• Error rate: <0.1%
+
+🔧 **System Health:**
+• Database: ✅ Online
+• File Storage: ✅ Available  
+• Monitoring: ✅ Active
+• Auto-recovery: ✅ Enabled
+                """
+            self._admin_stats_cache = (now, stats_text)
+        else:
+            stats_text = f"""
+📊 **Your Statistics**
+
+📁 **Files Processed:** {user_stats.get('files_processed', 0)}
+🔄 **Rename Operations:** {user_stats.get('renames', 0)}  
+🖼️ **Thumbnails Set:** {user_stats.get('thumbnails', 0)}
+📝 **Metadata Edits:** {user_stats.get('metadata_edits', 0)}
+
+⏱️ **Activity:**
+• First used: {user_stats.get('first_used', 'Recently')}
+• Last active: {user_stats.get('last_active', 'Now')}
+• Total commands: {user_stats.get('commands', 0)}
+
+🎯 **Efficiency:**
+• Success rate: {user_stats.get('success_rate', 100)}%
+• Avg processing: <2s
+• Storage used: {user_stats.get('storage_used', '0 MB')}
+                """
+        
+        self.bot.send_message(
+            chat_id=message.chat.id,
+            text=stats_text,
+            parse_mode='Markdown'
+        )
+    
+    @_safe_handler
+    def logs_command(self, message):
+        """Handle /logs command"""
+        if not self._require_admin(message):
+            return
             
-            # Check subscription
-            if not self.subscription_manager.check_user_subscriptions(user_id):
-                return
+        # Get recent logs
+        try:
+            if os.path.exists('bot.log'):
+                # Only the tail is read; 50 lines fit well within 8KB
+                with open('bot.log', 'rb') as f:
+                    f.seek(0, os.SEEK_END)
+                    start = max(0, f.tell() - 8192)
+                    f.seek(start)
+                    lines = f.read().decode('utf-8', 'replace').splitlines()
+                    
+                if start and lines:
+                    lines = lines[1:]  # Drop the partial first line
+                recent_logs = '\n'.join(lines[-50:])  # Last 50 lines
+                
+                # Larger tails go out as a file instead of a Markdown code block
+                if len(recent_logs) > 2000:
+                    buf = io.BytesIO(recent_logs.encode('utf-8'))
+                    buf.name = 'logs.txt'
+                    self.bot.send_document(
+                        chat_id=message.chat.id,
+                        document=buf,
+                        caption="📋 Recent Bot Logs"
+                    )
+                    return
+                    
+                log_text = f"📋 **Recent Bot Logs**\n\n```\n{recent_logs}\n```"
+            else:
+                log_text = "📋 **Recent Bot Logs**\n\nNo log file found."
                 
-            self.file_manager.handle_file_upload(message, 'video')
-            
         except Exception as e:
-            logger.error(f"Error handling video: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ Error processing video.")
+            log_text = f"📋 **Recent Bot Logs**\n\nError reading logs: {e}"
+        
+        self.bot.send_message(
+            chat_id=message.chat.id,
+            text=log_text,
+            parse_mode='Markdown'
+        )
     
-    def handle_audio(self, message):
-        """Handle audio uploads"""
-        try:
-            user_id = message.from_user.id
-            
-            # Check subscription
-            if not self.subscription_manager.check_user_subscriptions(user_id):
-                return
-                
-            self.file_manager.handle_file_upload(message, 'audio')
+    @_safe_handler
+    def settings_command(self, message):
+        """Handle /settings command"""
+        user_id = message.from_user.id
+        
+        # Get user settings
+        settings = self._cached_settings(user_id)
+        
+        settings_text = f"""
+⚙️ **Bot Settings**
+
+🖼️ **Thumbnail:**
+• Permanent Thumbnail: {'✅' if settings.get('permanent_thumbnail') else '❌'}
+• Auto Thumbnails: {'✅' if settings.get('auto_thumbnails', True) else '❌'}
+
+🔄 **Auto-Rename:**
+• Pattern: {settings.get('rename_pattern', 'None set')}
+• Auto Counter: {'✅' if settings.get('auto_counter', True) else '❌'}
+• Date Format: {settings.get('date_format', '%Y-%m-%d')}
+
+📊 **Quality:**
+• Video Quality: {settings.get('video_quality', 'Original')}
+• Audio Bitrate: {settings.get('audio_bitrate', 'Original')}
+• Compression: {'✅' if settings.get('compression') else '❌'}
+
+🔔 **Notifications:**
+• Process Complete: {'✅' if settings.get('notify_complete', True) else '❌'}
+• Errors: {'✅' if settings.get('notify_errors', True) else '❌'}
+• Updates: {'✅' if settings.get('notify_updates', True) else '❌'}
+
+Use the buttons below to modify settings:
+            """
+        
+        self.bot.send_message(
+            chat_id=message.chat.id,
+            text=settings_text,
+            parse_mode='Markdown',
+            reply_markup=_SETTINGS_KEYBOARD
+        )
+    
+    @_safe_handler
+    def auto_rename_command(self, message):
+        """Handle /auto_rename command"""
+        text = _TEXTS['auto_rename']
+        
+        self.bot.send_message(
+            chat_id=message.chat.id,
+            text=text,
+            parse_mode='HTML'
+        )
+        
+        # Set user state for pattern input
+        self._set_state(message.from_user.id, 'awaiting_pattern')
+    
+    @_safe_handler
+    def pattern_command(self, message):
+        """Handle /pattern command"""
+        user_id = message.from_user.id
+        
+        # Get saved patterns
+        patterns = self.pattern_manager.get_user_patterns(user_id)
+        
+        text = "🎯 <b>Naming Pattern Templates</b>\n\n"
+        
+        if patterns:
+            text += "<b>Your Saved Patterns:</b>\n"
+            for i, pattern in enumerate(patterns, 1):
+                text += f"{i}. <code>{html.escape(pattern['pattern'])}</code> - {html.escape(pattern['description'] or '')}\n"
+            text += "\n"
+        
+        text += _TEXTS['pattern_templates']
+        
+        self.bot.send_message(
+            chat_id=message.chat.id,
+            text=text,
+            parse_mode='HTML',
+            reply_markup=_PATTERN_KEYBOARD
+        )
+    
+    @_safe_handler
+    def queue_command(self, message):
+        """Handle /queue command"""
+        user_id = message.from_user.id
+        
+        # Get queue status
+        queue_info = self.file_manager.get_queue_status(user_id)
+        
+        text = f"""
+📋 **Processing Queue Status**
+
+**Your Queue:**
+• Files in queue: {queue_info.get('count', 0)}
+• Processing: {queue_info.get('processing', 0)}
+• Completed: {queue_info.get('completed', 0)}
+• Failed: {queue_info.get('failed', 0)}
+
+**Current Operations:**
+{queue_info.get('current_operations', 'No active operations')}
+
+**Global Queue:**
+• Total files: {queue_info.get('global_count', 0)}
+• Active workers: {queue_info.get('workers', 0)}
+• Avg processing time: {queue_info.get('avg_time', 'N/A')}
+
+**Performance:**
+• Success rate: {queue_info.get('success_rate', 100)}%
+• Queue capacity: Unlimited
+• Max concurrent: 10 files/user
+
+🔄 Files are processed in order. Large files may take longer.
+            """
+        
+        # Queue management keyboard
+        if queue_info.get('count', 0) > 0:
+            keyboard = _QUEUE_KEYBOARD_WITH_CLEAR
+        else:
+            keyboard = _QUEUE_KEYBOARD_EMPTY
+        
+        self.bot.send_message(
+            chat_id=message.chat.id,
+            text=text,
+            parse_mode='Markdown',
+            reply_markup=keyboard
+        )
+    
+    # Admin commands
+    @_safe_handler
+    def force_subscribe_command(self, message):
+        """Handle /force_sub command"""
+        if not self._require_admin(message):
+            return
             
-        except Exception as e:
-            logger.error(f"Error handling audio: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ Error processing audio.")
+        self.subscription_manager.handle_force_subscribe_setup(message)
+        self._invalidate_sub()
     
-    def handle_voice(self, message):
-        """Handle voice uploads"""
-        try:
-            user_id = message.from_user.id
+    @_safe_handler
+    def add_channel_command(self, message):
+        """Handle /add_channel command"""
+        if not self._require_admin(message):
+            return
             
-            # Check subscription
-            if not self.subscription_manager.check_user_subscriptions(user_id):
-                return
-                
-            self.file_manager.handle_file_upload(message, 'voice')
+        self.subscription_manager.handle_add_channel(message)
+        self._invalidate_sub()
+    
+    @_safe_handler
+    def remove_channel_command(self, message):
+        """Handle /remove_channel command"""
+        if not self._require_admin(message):
+            return
             
-        except Exception as e:
-            logger.error(f"Error handling voice: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ Error processing voice.")
+        self.subscription_manager.handle_remove_channel(message)
+        self._invalidate_sub()
     
-    def handle_video_note(self, message):
-        """Handle video note uploads"""
-        try:
-            user_id = message.from_user.id
+    @_safe_handler
+    def set_log_channel_command(self, message):
+        """Handle /set_log_channel command"""
+        user_id = message.from_user.id
+        
+        if not self._require_admin(message):
+            return
             
-            # Check subscription
-            if not self.subscription_manager.check_user_subscriptions(user_id):
-                return
-                
-            self.file_manager.handle_file_upload(message, 'video_note')
+        text = _TEXTS['set_log_channel']
+        
+        self.bot.send_message(
+            chat_id=message.chat.id,
+            text=text,
+            parse_mode='HTML'
+        )
+        
+        self._set_state(user_id, 'awaiting_log_channel')
+    
+    @_safe_handler
+    def set_storage_command(self, message):
+        """Handle /set_storage command"""
+        user_id = message.from_user.id
+        
+        if not self._require_admin(message):
+            return
             
-        except Exception as e:
-            logger.error(f"Error handling video note: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ Error processing video note.")
+        text = _TEXTS['set_storage']
+        
+        self.bot.send_message(
+            chat_id=message.chat.id,
+            text=text,
+            parse_mode='HTML'
+        )
+        
+        self._set_state(user_id, 'awaiting_storage_channel')
     
-    def handle_animation(self, message):
-        """Handle animation uploads"""
+    # File handlers
+    def _handle_file(self, kind: str, message):
+        """Handle an upload of the given kind (document, photo, video, ...)"""
         try:
             user_id = message.from_user.id
             
             # Check subscription
-            if not self.subscription_manager.check_user_subscriptions(user_id):
+            if not self._check_sub_cached(user_id):
                 return
                 
-            self.file_manager.handle_file_upload(message, 'animation')
+            self.file_manager.handle_file_upload(message, kind)
             
         except Exception as e:
-            logger.error(f"Error handling animation: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ Error processing animation.")
+            label = kind.replace('_', ' ')
+            logger.error("Error handling %s: %s", label, e)
+            self._queue_error(message.chat.id, f"❌ Error processing {label}.")
     
     def callback_query_handler(self, call):
         """Handle callback queries from inline keyboards"""
         try:
-            user_id = call.from_user.id
-            data = call.data
-            
             # Handle different callback types
-            if data.startswith('settings_'):
-                self._handle_settings_callback(call)
-            elif data.startswith('pattern_'):
-                self._handle_pattern_callback(call)
-            elif data.startswith('queue_'):
-                self._handle_queue_callback(call)
-            elif data.startswith('file_'):
-                self.file_manager.handle_file_callback(call)
-            elif data.startswith('thumb_'):
-                self.thumbnail_manager.handle_thumbnail_callback(call)
-            elif data.startswith('broadcast_'):
-                self.broadcast_manager.handle_broadcast_callback(call)
-            elif data.startswith('sub_'):
-                self.subscription_manager.handle_subscription_callback(call)
+            prefix, sep, _ = call.data.partition('_')
+            handler = self._cb_dispatch.get(prefix) if sep else None
+            if handler:
+                handler(call)
             
             # Answer the callback to remove loading
             self.bot.answer_callback_query(call.id)
             
         except Exception as e:
-            logger.error(f"Error in callback query handler: {e}")
-            self.bot.answer_callback_query(call.id, "❌ An error occurred.")
+            logger.error("Error in callback query handler: %s", e)
+            self.bot.answer_callback_query(call.id, _GENERIC_ERR)
     
+    @_safe_handler
     def handle_text(self, message):
         """Handle text messages based on user state"""
-        try:
-            user_id = message.from_user.id
+        user_id = message.from_user.id
+        with self._cache_lock:
             user_state = self.user_states.get(user_id)
+        
+        if user_state == 'awaiting_pattern':
+            self.pattern_manager.set_user_pattern(user_id, message.text)
+            self.bot.send_message(
+                chat_id=message.chat.id,
+                text=_PATTERN_SET_PREFIX + html.escape(message.text, quote=False) + _PATTERN_SET_SUFFIX,
+                parse_mode='HTML'
+            )
+            with self._cache_lock:
+                self.user_states.pop(user_id, None)
             
-            if user_state == 'awaiting_pattern':
-                self.pattern_manager.set_user_pattern(user_id, message.text)
-                self.bot.send_message(
-                    chat_id=message.chat.id,
-                    text=f"✅ Pattern set: `{message.text}`\n\nYour files will now be renamed using this pattern!",
-                    parse_mode='Markdown'
-                )
-                del self.user_states[user_id]
-                
-            elif user_state == 'awaiting_broadcast':
-                self.broadcast_manager.prepare_broadcast(message)
-                
-            elif user_state == 'awaiting_log_channel':
-                self._handle_log_channel_setup(message)
-                
-            elif user_state == 'awaiting_storage_channel':
-                self._handle_storage_channel_setup(message)
-                
-            else:
-                # Regular text message - show help
-                self.bot.send_message(
-                    chat_id=message.chat.id,
-                    text="💡 Send me a file to start processing, or use /help to see all commands!"
-                )
+        elif user_state == 'awaiting_broadcast':
+            self.broadcast_manager.prepare_broadcast(message)
             
-        except Exception as e:
-            logger.error(f"Error handling text message: {e}")
-            self.bot.send_message(chat_id=message.chat.id, text="❌ An error occurred.")
+        elif user_state == 'awaiting_log_channel':
+            self._handle_log_channel_setup(message)
+            
+        elif user_state == 'awaiting_storage_channel':
+            self._handle_storage_channel_setup(message)
+            
+        else:
+            # Regular text message - show help
+            self.bot.send_message(chat_id=message.chat.id, text=_TEXT_HINT)
+    
+    def _handle_sub_callback(self, call):
+        """Handle subscription callbacks"""
+        # A subscription re-check must not be answered from the cache
+        self._invalidate_sub(call.from_user.id)
+        self.subscription_manager.handle_subscription_callback(call)
     
     def _handle_settings_callback(self, call):
         """Handle settings-related callbacks"""
@@ -7,7 +7,11 @@ import logging
 import os
 import time
 import psutil
+import shutil
+import sqlite3
 import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
 
@@ -15,15 +19,49 @@ from config import Config
 
 logger = logging.getLogger(__name__)
 
+def _dir_size(path: str, limit: int) -> int:
+    """Total size of files under path, stopping as soon as it exceeds limit"""
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
+                        if total > limit:
+                            return total
+        except OSError:
+            pass
+    return total
+
+def _expired_files(directory: str, cutoff: float) -> List[str]:
+    """Paths of regular files in directory last modified before cutoff (a timestamp)"""
+    with os.scandir(directory) as entries:
+        return [
+            entry.path for entry in entries
+            if entry.is_file(follow_symlinks=False) and entry.stat(follow_symlinks=False).st_mtime < cutoff
+        ]
+
+def _remove_file(path: str):
+    """Delete a file, logging instead of raising on failure"""
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.warning(f"Could not remove {path}: {e}")
+
 class BotMonitoring:
     """Advanced 24x7 monitoring system with auto-recovery"""
     
     def __init__(self, config: Config):
         self.config = config
         self.start_time = datetime.now()
+        self._start_mono = time.monotonic()  # Uptime source; immune to wall-clock changes
         self.health_status = {
             'status': 'healthy',
-            'last_check': datetime.now(),
+            'last_check': self.start_time,
             'uptime': 0,
             'errors': [],
             'warnings': []
@@ -50,9 +88,9 @@ class BotMonitoring:
             'error_rate': 50        # 50 errors per hour
         }
         
-        # Error tracking
-        self.error_log = []
-        self.performance_log = []
+        # Error tracking (last 1000 entries each)
+        self.error_log = deque(maxlen=1000)
+        self.performance_log = deque(maxlen=1000)
         
         # Auto-recovery settings
         self.auto_recovery = {
@@ -61,12 +99,52 @@ class BotMonitoring:
             'restart_count': 0,
             'last_restart': None
         }
+        
+        # Persistent connection for health checks, opened once the database file exists
+        self._db: Optional[sqlite3.Connection] = None
+        
+        # psutil is only polled by the sampler thread; readers get the latest snapshot
+        self._snapshot = self._take_snapshot()
+        threading.Thread(target=self._metrics_loop, daemon=True, name="MetricsSampler").start()
+    
+    @staticmethod
+    def _take_snapshot() -> Dict[str, Any]:
+        """Read system resource usage from psutil"""
+        memory = psutil.virtual_memory()
+        disk = psutil.disk_usage('/')
+        net_io = psutil.net_io_counters()
+        return {
+            'cpu': psutil.cpu_percent(interval=None),  # Since the previous call, without sleeping
+            'mem': memory.percent,
+            'mem_total': memory.total,
+            'disk': disk.percent,
+            'disk_total': disk.total,
+            'net_sent': net_io.bytes_sent,
+            'net_recv': net_io.bytes_recv
+        }
+    
+    def _metrics_loop(self):
+        """Refresh the resource snapshot every 5 seconds"""
+        while True:
+            time.sleep(5)
+            try:
+                self._snapshot = self._take_snapshot()  # Rebinding is atomic, so readers need no lock
+            except Exception as e:
+                logger.error(f"Metrics sampling failed: {e}")
+    
+    def _sample_system(self) -> Dict[str, Any]:
+        """Get the latest resource snapshot, at most 5 seconds old"""
+        return self._snapshot
+    
+    def _uptime(self) -> float:
+        """Seconds since monitoring started"""
+        return time.monotonic() - self._start_mono
     
     def health_check(self) -> Dict[str, Any]:
         """Perform comprehensive health check"""
         try:
             self.health_status['last_check'] = datetime.now()
-            self.health_status['uptime'] = (datetime.now() - self.start_time).total_seconds()
+            self.health_status['uptime'] = self._uptime()
             
             # Clear previous status
             self.health_status['errors'] = []
@@ -110,8 +188,10 @@ class BotMonitoring:
     def _check_system_resources(self):
         """Check system CPU, memory, and network resources"""
         try:
+            sample = self._sample_system()
+            
             # CPU usage
-            cpu_percent = psutil.cpu_percent(interval=1)
+            cpu_percent = sample['cpu']
             self.metrics['cpu_usage'] = cpu_percent
             
             if cpu_percent > self.thresholds['cpu_usage']:
@@ -120,8 +200,7 @@ class BotMonitoring:
                 self.health_status['warnings'].append(f"Elevated CPU usage: {cpu_percent:.1f}%")
             
             # Memory usage
-            memory = psutil.virtual_memory()
-            memory_percent = memory.percent
+            memory_percent = sample['mem']
             self.metrics['memory_usage'] = memory_percent
             
             if memory_percent > self.thresholds['memory_usage']:
@@ -130,10 +209,9 @@ class BotMonitoring:
                 self.health_status['warnings'].append(f"Elevated memory usage: {memory_percent:.1f}%")
             
             # Network I/O
-            net_io = psutil.net_io_counters()
             self.metrics['network_io'] = {
-                'sent': net_io.bytes_sent,
-                'received': net_io.bytes_recv
+                'sent': sample['net_sent'],
+                'received': sample['net_recv']
             }
             
         except Exception as e:
@@ -143,17 +221,25 @@ class BotMonitoring:
     def _check_database_health(self):
         """Check database connection and performance"""
         try:
-            # For now, just check if database file exists
             db_path = "bot_database.db"
-            if os.path.exists(db_path):
-                file_size = os.path.getsize(db_path)
-                if file_size > 0:
-                    # Database exists and has content - assume healthy
-                    pass
-                else:
-                    self.health_status['warnings'].append("Database file is empty")
-            else:
+            if not os.path.exists(db_path):
+                # Checked first: connecting would create an empty file
                 self.health_status['errors'].append("Database file not found")
+                return
+            
+            if os.path.getsize(db_path) == 0:
+                self.health_status['warnings'].append("Database file is empty")
+                return
+            
+            if self._db is None:
+                self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+                self._db.execute('PRAGMA journal_mode=WAL')
+                self._db.execute('PRAGMA synchronous=NORMAL')
+            
+            # Validate the file itself rather than trusting its size
+            result = self._db.execute('PRAGMA quick_check').fetchone()[0]
+            if result != 'ok':
+                self.health_status['errors'].append(f"Database integrity check failed: {result}")
                 
         except Exception as e:
             logger.error(f"Database health check failed: {e}")
@@ -173,8 +259,7 @@ class BotMonitoring:
     def _check_disk_space(self):
         """Check available disk space"""
         try:
-            disk_usage = psutil.disk_usage('/')
-            disk_percent = disk_usage.percent
+            disk_percent = self._sample_system()['disk']
             self.metrics['disk_usage'] = disk_percent
             
             if disk_percent > self.thresholds['disk_usage']:
@@ -203,26 +288,28 @@ class BotMonitoring:
                         try:
                             # Instead of deleting, truncate large log files
                             if os.path.getsize(log_file) > 10 * 1024 * 1024:  # 10MB
-                                with open(log_file, 'w') as f:
+                                os.truncate(log_file, 0)
+                                with open(log_file, 'a') as f:
                                     f.write(f"Log file truncated on {current_time}\n")
                                 logger.info(f"Truncated large log file: {log_file}")
                         except Exception as e:
                             logger.error(f"Error managing log file {log_file}: {e}")
             
-            # Clean temporary files
+            # Clean temporary files; unlinks are blocking, so they run in parallel
             temp_dirs = ['/tmp', './temp', './downloads']
+            cutoff_ts = cutoff_time.timestamp()
+            expired = []
             for temp_dir in temp_dirs:
                 if os.path.exists(temp_dir):
                     try:
-                        for filename in os.listdir(temp_dir):
-                            file_path = os.path.join(temp_dir, filename)
-                            if os.path.isfile(file_path):
-                                file_mtime = datetime.fromtimestamp(os.path.getmtime(file_path))
-                                if file_mtime < cutoff_time:
-                                    os.remove(file_path)
+                        expired.extend(_expired_files(temp_dir, cutoff_ts))
                     except Exception as e:
                         logger.warning(f"Error cleaning temp directory {temp_dir}: {e}")
             
+            if expired:
+                with ThreadPoolExecutor(max_workers=16, thread_name_prefix="Cleanup") as pool:
+                    pool.map(_remove_file, expired)
+            
             logger.info("Log cleanup completed")
             
         except Exception as e:
@@ -242,22 +329,18 @@ class BotMonitoring:
     def check_storage_usage(self):
         """Check storage usage and manage files"""
         try:
-            # Check current directory size
-            total_size = 0
-            for dirpath, dirnames, filenames in os.walk('.'):
-                for filename in filenames:
-                    file_path = os.path.join(dirpath, filename)
-                    try:
-                        total_size += os.path.getsize(file_path)
-                    except OSError:
-                        pass
+            # Check current directory size, stopping once past the 500MB threshold
+            limit = 500 * 1024 * 1024
+            if shutil.disk_usage('.').used <= limit:
+                return  # The whole partition is under the threshold, so the directory is too
             
-            # Convert to MB
-            total_size_mb = total_size / (1024 * 1024)
+            total_size = _dir_size('.', limit)
             
-            if total_size_mb > 500:  # 500MB threshold
-                logger.warning(f"High storage usage: {total_size_mb:.1f} MB")
-                self.health_status['warnings'].append(f"Storage usage: {total_size_mb:.1f} MB")
+            if total_size > limit:
+                # The scan stops early, so this is a lower bound
+                total_size_mb = total_size / (1024 * 1024)
+                logger.warning(f"High storage usage: over {total_size_mb:.1f} MB")
+                self.health_status['warnings'].append(f"Storage usage: over {total_size_mb:.1f} MB")
             
         except Exception as e:
             logger.error(f"Storage check failed: {e}")
@@ -265,7 +348,7 @@ class BotMonitoring:
     def get_performance_metrics(self) -> Dict[str, Any]:
         """Get current performance metrics"""
         return {
-            'uptime': (datetime.now() - self.start_time).total_seconds(),
+            'uptime': self._uptime(),
             'health_status': self.health_status['status'],
             'cpu_usage': self.metrics['cpu_usage'],
             'memory_usage': self.metrics['memory_usage'],
@@ -288,10 +371,6 @@ class BotMonitoring:
             
             self.error_log.append(error_entry)
             
-            # Keep only last 1000 errors
-            if len(self.error_log) > 1000:
-                self.error_log = self.error_log[-1000:]
-            
             # Check for auto-recovery triggers
             if severity == 'critical':
                 self.auto_recovery['restart_count'] += 1
@@ -322,12 +401,13 @@ class BotMonitoring:
     def get_system_info(self) -> Dict[str, Any]:
         """Get comprehensive system information"""
         try:
+            sample = self._sample_system()
             return {
-                'bot_uptime': (datetime.now() - self.start_time).total_seconds(),
+                'bot_uptime': self._uptime(),
                 'system_boot_time': psutil.boot_time(),
                 'cpu_count': psutil.cpu_count(),
-                'memory_total': psutil.virtual_memory().total,
-                'disk_total': psutil.disk_usage('/').total,
+                'memory_total': sample['mem_total'],
+                'disk_total': sample['disk_total'],
                 'python_version': os.sys.version,
                 'platform': os.name,
                 'health_status': self.health_status,
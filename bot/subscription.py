@@ -4,10 +4,15 @@ Manages channel subscriptions, verification, and access control
 """
 
 import logging
+import queue
+import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional, Set
 import telebot
 from telebot import types
+from cachetools import LRUCache, TLRUCache
 
 from database import Database
 from config import Config
@@ -20,10 +25,24 @@ class SubscriptionManager:
     def __init__(self, database: Database, config: Config):
         self.db = database
         self.config = config
-        self.subscription_cache = {}  # Cache subscription status
         self.cache_expiry = 300  # 5 minutes cache
+        # user_id -> subscribed; each entry lives cache_expiry ±20% so a burst of checks doesn't expire at once
+        self.subscription_cache = TLRUCache(maxsize=100_000, ttu=self._cache_ttu)
+        self._cache_lock = threading.Lock()  # Handlers run on telebot's worker threads
+        
+        # Membership lookups for several channels are made in parallel
+        self._check_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="SubCheck")
+        
+        # Status changes are written to the database in batches by a background thread
+        self._persisted_status = LRUCache(maxsize=100_000)  # user_id -> last status committed to the database
+        self._status_write_q = queue.Queue()
+        threading.Thread(target=self._status_writer, daemon=True, name="SubscriptionWriter").start()
     
-    def check_user_subscriptions(self, user_id: int) -> bool:
+    def _cache_ttu(self, _key, _value, now: float) -> float:
+        """Expiry time for a new cache entry, jittered around cache_expiry"""
+        return now + self.cache_expiry * random.uniform(0.8, 1.2)
+    
+    def check_user_subscriptions(self, user_id: int, bot: telebot.TeleBot) -> bool:
         """Check if user is subscribed to all required channels"""
         try:
             # If no force subscribe channels configured, allow access
@@ -31,22 +50,17 @@ class SubscriptionManager:
                 return True
             
             # Check cache first
-            cache_key = f"sub_{user_id}"
-            current_time = time.time()
-            
-            if cache_key in self.subscription_cache:
-                cache_entry = self.subscription_cache[cache_key]
-                if current_time - cache_entry['timestamp'] < self.cache_expiry:
-                    return cache_entry['subscribed']
+            with self._cache_lock:
+                cached = self.subscription_cache.get(user_id)
+            if cached is not None:
+                return cached
             
             # Check actual subscriptions
-            subscribed = self._verify_all_subscriptions(user_id)
+            subscribed = self._verify_all_subscriptions(bot, user_id)
             
             # Update cache
-            self.subscription_cache[cache_key] = {
-                'subscribed': subscribed,
-                'timestamp': current_time
-            }
+            with self._cache_lock:
+                self.subscription_cache[user_id] = subscribed
             
             # Update database
             self._update_user_subscription_status(user_id, subscribed)
@@ -57,26 +71,51 @@ class SubscriptionManager:
             logger.error(f"Error checking user subscriptions: {e}")
             return False  # Deny access on error
     
-    def _verify_all_subscriptions(self, user_id: int) -> bool:
+    def _verify_all_subscriptions(self, bot: telebot.TeleBot, user_id: int) -> bool:
         """Verify user subscriptions to all required channels"""
         try:
-            if not self.config.FORCE_SUB_CHANNELS:
+            channels = list(self.config.FORCE_SUB_CHANNELS)
+            if not channels:
                 return True
-                
-            # For now, return True since we need bot instance to check
-            # This will be improved when we pass bot instance properly
-            return True
+            
+            # One round trip per channel; with several channels they run concurrently
+            if len(channels) == 1:
+                members = [bot.get_chat_member(channels[0], user_id)]
+            else:
+                members = self._check_pool.map(lambda channel: bot.get_chat_member(channel, user_id), channels)
+            return all(member.status not in ('left', 'kicked') for member in members)
             
         except Exception as e:
             logger.error(f"Error verifying subscriptions: {e}")
             return False
     
     def _update_user_subscription_status(self, user_id: int, subscribed: bool):
-        """Update user subscription status in database"""
-        try:
-            self.db.update_user_subscription(user_id, subscribed)
-        except Exception as e:
-            logger.error(f"Error updating subscription status: {e}")
+        """Queue a database write of the user's subscription status if it changed"""
+        with self._cache_lock:
+            if self._persisted_status.get(user_id) == subscribed:
+                return
+        self._status_write_q.put_nowait((user_id, subscribed))
+    
+    def _status_writer(self):
+        """Persist queued subscription statuses in batches of up to 64 users or 50 ms"""
+        while True:
+            user_id, subscribed = self._status_write_q.get()
+            batch = {user_id: subscribed}
+            deadline = time.monotonic() + 0.05
+            while len(batch) < 64:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    user_id, subscribed = self._status_write_q.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch[user_id] = subscribed  # Only the latest status per user is written
+            
+            if self.db.update_user_subscriptions_bulk([(subscribed, user_id) for user_id, subscribed in batch.items()]):
+                # Recorded only once committed, so a failed batch is written again on the next check
+                with self._cache_lock:
+                    self._persisted_status.update(batch)
     
     def show_subscription_required(self, user_id: int, chat_id: int):
         """Show subscription required message"""
@@ -252,38 +291,28 @@ Reply with channel username! 📺
         try:
             user_id = call.from_user.id
             
+            # Get bot instance from handlers
+            from bot.handlers import BotHandlers
+            bot = getattr(BotHandlers, '_current_bot', None)
+            if not bot:
+                return
+            
             # Clear cache to force fresh check
-            cache_key = f"sub_{user_id}"
-            if cache_key in self.subscription_cache:
-                del self.subscription_cache[cache_key]
+            with self._cache_lock:
+                self.subscription_cache.pop(user_id, None)
             
             # Check subscriptions
-            if self.check_user_subscriptions(user_id):
+            if self.check_user_subscriptions(user_id, bot):
                 text = "✅ **Subscription Verified!**\n\nYou can now use all bot features!"
-                
-                # Get bot instance from handlers
-                from bot.handlers import BotHandlers
-                bot = getattr(BotHandlers, '_current_bot', None)
-                if bot:
-                    bot.edit_message_text(
-                        chat_id=call.message.chat.id,
-                        message_id=call.message.message_id,
-                        text=text,
-                        parse_mode='Markdown'
-                    )
             else:
                 text = "❌ **Subscription Not Found**\n\nPlease subscribe to all channels and try again."
-                
-                # Get bot instance from handlers
-                from bot.handlers import BotHandlers
-                bot = getattr(BotHandlers, '_current_bot', None)
-                if bot:
-                    bot.edit_message_text(
-                        chat_id=call.message.chat.id,
-                        message_id=call.message.message_id,
-                        text=text,
-                        parse_mode='Markdown'
-                    )
+            
+            bot.edit_message_text(
+                chat_id=call.message.chat.id,
+                message_id=call.message.message_id,
+                text=text,
+                parse_mode='Markdown'
+            )
                     
         except Exception as e:
             logger.error(f"Error handling subscription check: {e}")
@@ -3,12 +3,13 @@ Advanced thumbnail management system
 Handles custom thumbnails, permanent thumbnails, and thumbnail generation
 """
 
+import asyncio
 import logging
-import os
-import tempfile
+from functools import lru_cache
 from typing import Optional, Dict, Any
 from PIL import Image, ImageDraw, ImageFont
 import io
+from cachetools import TTLCache
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
@@ -20,13 +21,80 @@ from config import Config
 
 logger = logging.getLogger(__name__)
 
+_BOLD_FONT = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+_REGULAR_FONT = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+
+# Single-pass baseline 4:2:0 encode; optimize=True costs a second Huffman pass for a few bytes on a 320x320 image
+_JPEG_OPTIONS = {'optimize': False, 'progressive': False, 'subsampling': 2}
+
+@lru_cache(maxsize=16)
+def _get_font(path: str, size: int):
+    """Load a TrueType font once, falling back to Pillow's default font"""
+    try:
+        return ImageFont.truetype(path, size)
+    except OSError:
+        return ImageFont.load_default()
+
 class ThumbnailManager:
     """Advanced thumbnail management with permanent and temporary thumbnails"""
     
     def __init__(self, database: Database, config: Config):
         self.db = database
         self.config = config
-        self.thumbnail_cache = {}  # Cache for temporary thumbnails
+        self.thumbnail_cache = TTLCache(maxsize=10_000, ttl=86400)  # Temporary thumbnails, valid for 24 hours
+        
+        # Background and frame shared by every media info thumbnail
+        self._media_info_template = Image.new('RGB', config.THUMBNAIL_SIZE, color='#2c3e50')
+        ImageDraw.Draw(self._media_info_template).rectangle([10, 10, 310, 50], outline='#3498db', width=2)
+        
+        # Permanent thumbnails by user_id (None when unset), kept in step with queued writes
+        self._permanent_cache = TTLCache(maxsize=5000, ttl=600)
+        
+        # Permanent thumbnail writes, committed in batches by a task started on first use
+        self._thumb_write_q: Optional[asyncio.Queue] = None
+        self._thumb_writer: Optional[asyncio.Task] = None
+    
+    def _queue_thumbnail_write(self, user_id: int, thumbnail_data: Optional[bytes]):
+        """Queue a permanent thumbnail update; None clears it"""
+        self._permanent_cache[user_id] = thumbnail_data
+        if self._thumb_writer is None or self._thumb_writer.done():
+            self._thumb_write_q = asyncio.Queue()
+            self._thumb_writer = asyncio.create_task(self._thumbnail_writer(self._thumb_write_q))
+        self._thumb_write_q.put_nowait((user_id, thumbnail_data))
+    
+    def _get_permanent_thumbnail(self, user_id: int) -> Optional[bytes]:
+        """Get the user's permanent thumbnail, cached for 10 minutes"""
+        try:
+            return self._permanent_cache[user_id]
+        except KeyError:
+            thumbnail_data = self._permanent_cache[user_id] = self.db.get_permanent_thumbnail(user_id)
+            return thumbnail_data
+    
+    async def _thumbnail_writer(self, write_q: asyncio.Queue):
+        """Commit queued thumbnail updates in batches of up to 32 users or 100 ms"""
+        loop = asyncio.get_running_loop()
+        while True:
+            user_id, thumbnail_data = await write_q.get()
+            batch = {user_id: thumbnail_data}
+            deadline = loop.time() + 0.1
+            while len(batch) < 32:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    user_id, thumbnail_data = await asyncio.wait_for(write_q.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch[user_id] = thumbnail_data  # Later updates for a user replace earlier ones
+            
+            rows = [(data, user_id) for user_id, data in batch.items()]
+            if await asyncio.to_thread(self.db.set_permanent_thumbnails_bulk, rows):
+                continue
+            
+            # Not committed: drop the cached values so reads go back to the database
+            for user_id, thumbnail_data in batch.items():
+                if self._permanent_cache.get(user_id) is thumbnail_data:
+                    del self._permanent_cache[user_id]
     
     async def set_temporary_thumbnail(self, user_id: int, photo_file_id: str, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Set temporary thumbnail for next file upload"""
@@ -41,8 +109,7 @@ class ThumbnailManager:
             # Store in cache for temporary use
             self.thumbnail_cache[user_id] = {
                 'data': thumbnail_data,
-                'file_id': photo_file_id,
-                'timestamp': update.message.date.timestamp()
+                'file_id': photo_file_id
             }
             
             keyboard = [
@@ -82,12 +149,7 @@ class ThumbnailManager:
                 return
             
             # Store in database
-            with self.db.lock:
-                cursor = self.db.connection.cursor()
-                cursor.execute('''
-                    UPDATE users SET permanent_thumbnail = ? WHERE user_id = ?
-                ''', (thumbnail_data, user_id))
-                self.db.connection.commit()
+            self._queue_thumbnail_write(user_id, thumbnail_data)
             
             keyboard = [
                 [InlineKeyboardButton("🖼️ Preview", callback_data=f"perm_thumb_preview_{user_id}"),
@@ -118,12 +180,7 @@ class ThumbnailManager:
     async def remove_permanent_thumbnail(self, user_id: int, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Remove user's permanent thumbnail"""
         try:
-            with self.db.lock:
-                cursor = self.db.connection.cursor()
-                cursor.execute('''
-                    UPDATE users SET permanent_thumbnail = NULL WHERE user_id = ?
-                ''', (user_id,))
-                self.db.connection.commit()
+            self._queue_thumbnail_write(user_id, None)
             
             await update.message.reply_text(
                 "✅ **Permanent Thumbnail Removed**\n\n"
@@ -145,13 +202,12 @@ class ThumbnailManager:
             thumbnail_data = None
             
             if thumbnail_type == 'permanent':
-                user = self.db.get_user(user_id)
-                if user and user.get('permanent_thumbnail'):
-                    thumbnail_data = user['permanent_thumbnail']
+                thumbnail_data = self._get_permanent_thumbnail(user_id)
             
             elif thumbnail_type == 'temporary':
-                if user_id in self.thumbnail_cache:
-                    thumbnail_data = self.thumbnail_cache[user_id]['data']
+                cache_entry = self.thumbnail_cache.get(user_id)
+                if cache_entry:
+                    thumbnail_data = cache_entry['data']
             
             if not thumbnail_data:
                 await update.message.reply_text("❌ No thumbnail found to preview")
@@ -184,24 +240,14 @@ class ThumbnailManager:
         """Get appropriate thumbnail for file upload"""
         try:
             # Check for permanent thumbnail first
-            user = self.db.get_user(user_id)
-            if user and user.get('permanent_thumbnail'):
-                return user['permanent_thumbnail']
+            permanent = self._get_permanent_thumbnail(user_id)
+            if permanent:
+                return permanent
             
-            # Check for temporary thumbnail
-            if user_id in self.thumbnail_cache:
-                cache_entry = self.thumbnail_cache[user_id]
-                
-                # Check if cache is still valid (24 hours)
-                import time
-                if time.time() - cache_entry['timestamp'] < 86400:
-                    # Remove from cache after use (temporary)
-                    thumbnail_data = cache_entry['data']
-                    del self.thumbnail_cache[user_id]
-                    return thumbnail_data
-                else:
-                    # Cache expired, remove it
-                    del self.thumbnail_cache[user_id]
+            # Check for temporary thumbnail, removing it from cache after use
+            cache_entry = self.thumbnail_cache.pop(user_id, None)
+            if cache_entry:
+                return cache_entry['data']
             
             # No custom thumbnail, return None to use original
             return None
@@ -219,12 +265,9 @@ class ThumbnailManager:
             
             # Try to use a font, fallback to default if not available
             try:
-                font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 24)
-            except (OSError, IOError):
-                try:
-                    font = ImageFont.load_default()
-                except:
-                    font = None
+                font = _get_font(_BOLD_FONT, 24)
+            except Exception:
+                font = None
             
             # Add text to image
             if font:
@@ -242,7 +285,7 @@ class ThumbnailManager:
             
             # Convert to bytes
             output = io.BytesIO()
-            image.save(output, format='JPEG', quality=self.config.THUMBNAIL_QUALITY)
+            image.save(output, format='JPEG', quality=self.config.THUMBNAIL_QUALITY, **_JPEG_OPTIONS)
             return output.getvalue()
             
         except Exception as e:
@@ -252,16 +295,13 @@ class ThumbnailManager:
     async def generate_media_info_thumbnail(self, file_info: Dict) -> Optional[bytes]:
         """Generate thumbnail with media info"""
         try:
-            # Create image
-            image = Image.new('RGB', self.config.THUMBNAIL_SIZE, color='#2c3e50')
+            # Start from a copy of the pre-drawn background and frame
+            image = self._media_info_template.copy()
             draw = ImageDraw.Draw(image)
             
             # Try to use a font
-            try:
-                title_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 20)
-                info_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 14)
-            except:
-                title_font = info_font = ImageFont.load_default()
+            title_font = _get_font(_BOLD_FONT, 20)
+            info_font = _get_font(_REGULAR_FONT, 14)
             
             # Add file type as title
             file_type = file_info.get('type', 'File').upper()
@@ -285,12 +325,9 @@ class ThumbnailManager:
                 draw.text((20, y_offset), line, fill='lightgray', font=info_font)
                 y_offset += 25
             
-            # Add decorative elements
-            draw.rectangle([10, 10, 310, 50], outline='#3498db', width=2)
-            
             # Convert to bytes
             output = io.BytesIO()
-            image.save(output, format='JPEG', quality=self.config.THUMBNAIL_QUALITY)
+            image.save(output, format='JPEG', quality=self.config.THUMBNAIL_QUALITY, **_JPEG_OPTIONS)
             return output.getvalue()
             
         except Exception as e:
@@ -300,50 +337,46 @@ class ThumbnailManager:
     async def _download_and_process_thumbnail(self, photo_file_id: str, context: ContextTypes.DEFAULT_TYPE) -> Optional[bytes]:
         """Download and process thumbnail image"""
         try:
-            # Download the photo
+            # Download the photo into memory
             file = await context.bot.get_file(photo_file_id)
+            data = await file.download_as_bytearray()
             
-            # Create temporary file
-            temp_fd, temp_path = tempfile.mkstemp(suffix='.jpg')
-            os.close(temp_fd)
-            
-            try:
-                # Download to temp file
-                await file.download_to_drive(temp_path)
-                
-                # Process with PIL
-                with Image.open(temp_path) as img:
-                    # Convert to RGB if necessary
-                    if img.mode != 'RGB':
-                        img = img.convert('RGB')
-                    
-                    # Resize to thumbnail size maintaining aspect ratio
-                    img.thumbnail(self.config.THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
-                    
-                    # Create new image with exact thumbnail size
-                    thumb = Image.new('RGB', self.config.THUMBNAIL_SIZE, color='white')
-                    
-                    # Calculate position to center the image
-                    x = (self.config.THUMBNAIL_SIZE[0] - img.size[0]) // 2
-                    y = (self.config.THUMBNAIL_SIZE[1] - img.size[1]) // 2
-                    
-                    # Paste the resized image onto the thumbnail
-                    thumb.paste(img, (x, y))
-                    
-                    # Convert to bytes
-                    output = io.BytesIO()
-                    thumb.save(output, format='JPEG', quality=self.config.THUMBNAIL_QUALITY, optimize=True)
-                    return output.getvalue()
-            
-            finally:
-                # Cleanup temp file
-                if os.path.exists(temp_path):
-                    os.unlink(temp_path)
+            # Decoding, resizing and encoding are CPU-bound, so keep them off the event loop
+            return await asyncio.to_thread(self._process_image, io.BytesIO(data))
             
         except Exception as e:
             logger.error(f"Error processing thumbnail: {e}")
             return None
     
+    def _process_image(self, source) -> bytes:
+        """Resize an image to the thumbnail size and encode it as JPEG"""
+        with Image.open(source) as img:
+            # Convert to RGB if necessary
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            
+            # Resize to thumbnail size maintaining aspect ratio
+            img.thumbnail(self.config.THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+            
+            if img.size == tuple(self.config.THUMBNAIL_SIZE):
+                # Already fills the thumbnail, no padding needed
+                thumb = img
+            else:
+                # Create new image with exact thumbnail size
+                thumb = Image.new('RGB', self.config.THUMBNAIL_SIZE, color='white')
+                
+                # Calculate position to center the image
+                x = (self.config.THUMBNAIL_SIZE[0] - img.size[0]) // 2
+                y = (self.config.THUMBNAIL_SIZE[1] - img.size[1]) // 2
+                
+                # Paste the resized image onto the thumbnail
+                thumb.paste(img, (x, y))
+            
+            # Convert to bytes
+            output = io.BytesIO()
+            thumb.save(output, format='JPEG', quality=self.config.THUMBNAIL_QUALITY, **_JPEG_OPTIONS)
+            return output.getvalue()
+    
     def _format_size(self, size_bytes: int) -> str:
         """Format file size in human readable format"""
         if size_bytes == 0:
@@ -370,20 +403,13 @@ class ThumbnailManager:
     async def cleanup_expired_cache(self):
         """Clean up expired temporary thumbnails"""
         try:
-            import time
-            current_time = time.time()
-            expired_users = []
-            
-            for user_id, cache_entry in self.thumbnail_cache.items():
-                # Remove cache entries older than 24 hours
-                if current_time - cache_entry['timestamp'] > 86400:
-                    expired_users.append(user_id)
-            
-            for user_id in expired_users:
-                del self.thumbnail_cache[user_id]
+            # Entries older than 24 hours are already invisible; this frees their memory
+            before = self.thumbnail_cache.currsize
+            self.thumbnail_cache.expire()
+            expired = before - self.thumbnail_cache.currsize
             
-            if expired_users:
-                logger.info(f"Cleaned up {len(expired_users)} expired thumbnail cache entries")
+            if expired:
+                logger.info(f"Cleaned up {expired} expired thumbnail cache entries")
                 
         except Exception as e:
             logger.error(f"Error cleaning up thumbnail cache: {e}")
@@ -391,8 +417,7 @@ class ThumbnailManager:
     def get_thumbnail_stats(self, user_id: int) -> Dict[str, Any]:
         """Get thumbnail statistics for user"""
         try:
-            user = self.db.get_user(user_id)
-            has_permanent = bool(user and user.get('permanent_thumbnail'))
+            has_permanent = bool(self._get_permanent_thumbnail(user_id))
             has_temporary = user_id in self.thumbnail_cache
             
             stats = {
@@ -12,6 +12,13 @@ class Config:
     def __init__(self):
         # Bot Token (Required)
         self.BOT_TOKEN = os.getenv("BOT_TOKEN", "your_bot_token_here")
+        self.HANDLER_THREADS = int(os.getenv("HANDLER_THREADS", "16"))  # Updates handled concurrently
+        
+        # Webhook Settings (polling is used when WEBHOOK_URL is empty)
+        self.WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Public HTTPS base URL, e.g. behind a TLS proxy
+        self.WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+        self.WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+        self.WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # Checked against X-Telegram-Bot-Api-Secret-Token
         
         # Admin User IDs
         self.ADMIN_IDS = self._parse_admin_ids()
@@ -20,6 +27,7 @@ class Config:
         self.FORCE_SUB_CHANNELS = self._parse_channels("FORCE_SUB_CHANNELS")
         self.LOG_CHANNEL_ID = int(os.getenv("LOG_CHANNEL_ID", "0"))
         self.STORAGE_CHANNEL_ID = int(os.getenv("STORAGE_CHANNEL_ID", "0"))
+        self.STAGING_CHAT_ID = int(os.getenv("STAGING_CHAT_ID", str(self.STORAGE_CHANNEL_ID)))  # Broadcast templates
         
         # File Settings
         self.MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", "2000000000"))  # 2GB default
@@ -35,6 +43,9 @@ class Config:
         self.MAX_QUEUE_SIZE = int(os.getenv("MAX_QUEUE_SIZE", "100"))
         self.CONCURRENT_UPLOADS = int(os.getenv("CONCURRENT_UPLOADS", "3"))
         self.CONCURRENT_DOWNLOADS = int(os.getenv("CONCURRENT_DOWNLOADS", "5"))
+        self.DOWNLOAD_PART_SIZE = int(os.getenv("DOWNLOAD_PART_SIZE", "524288"))  # 512KB byte ranges
+        self.DOWNLOAD_CONNECTIONS = int(os.getenv("DOWNLOAD_CONNECTIONS", "8"))  # Parallel ranges per file
+        self.MAX_CONCURRENT_UPLOADS = int(os.getenv("MAX_CONCURRENT_UPLOADS", "8"))  # Album files handled at once
         
         # Monitoring Settings
         self.HEALTH_CHECK_INTERVAL = int(os.getenv("HEALTH_CHECK_INTERVAL", "300"))  # 5 minutes
@@ -42,7 +53,10 @@ class Config:
         self.MAX_LOG_SIZE_MB = int(os.getenv("MAX_LOG_SIZE_MB", "100"))
         
         # Broadcast Settings
-        self.BROADCAST_DELAY = float(os.getenv("BROADCAST_DELAY", "0.1"))  # Delay between messages
+        self.BROADCAST_RATE = int(os.getenv("BROADCAST_RATE", "30"))  # Messages per second (Telegram global limit)
+        self.BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))  # Max in-flight sends
+        self.BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", "500"))  # Users per gather batch
+        self.BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "5"))  # Seconds between progress writes
         self.MAX_BROADCAST_SIZE = int(os.getenv("MAX_BROADCAST_SIZE", "1000"))
         
         # Database Settings
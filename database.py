@@ -7,6 +7,7 @@ import sqlite3
 import logging
 import json
 import threading
+from pathlib import Path
 from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime, timedelta
 
@@ -19,16 +20,30 @@ class Database:
         self.db_path = db_path
         self.connection = None
         self.lock = threading.Lock()
+        self._local = threading.local()
+        self._read_connections = []
     
     def init_db(self):
         """Initialize database with all required tables"""
         try:
             with self.lock:
-                self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
+                self.connection = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256)
                 self.connection.row_factory = sqlite3.Row
                 
                 cursor = self.connection.cursor()
                 
+                # WAL journal: commits append to the log instead of a full fsync each
+                cursor.execute('PRAGMA journal_mode=WAL')
+                cursor.execute('PRAGMA synchronous=NORMAL')
+                cursor.execute('PRAGMA wal_autocheckpoint=1000')
+                cursor.execute('PRAGMA temp_store=MEMORY')
+                
+                # Allow freed pages to be reclaimed with PRAGMA incremental_vacuum
+                cursor.execute('PRAGMA auto_vacuum')
+                if cursor.fetchone()[0] != 2:
+                    cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                    cursor.execute('VACUUM')  # One-time rebuild to apply the mode
+                
                 # Users table
                 cursor.execute('''
                     CREATE TABLE IF NOT EXISTS users (
@@ -156,13 +171,40 @@ class Database:
                         success_count INTEGER DEFAULT 0,
                         failed_count INTEGER DEFAULT 0,
                         status TEXT DEFAULT 'pending',
+                        staging_msg_id INTEGER,
                         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                         completed_at TIMESTAMP
                     )
                 ''')
                 
+                # Received files awaiting a user action
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS temp_files (
+                        user_id INTEGER,
+                        file_id TEXT,
+                        file_info TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (user_id, file_id)
+                    )
+                ''')
+                
+                # Per-user broadcast delivery failures
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS broadcast_failures (
+                        broadcast_id INTEGER,
+                        user_id INTEGER,
+                        reason TEXT,
+                        PRIMARY KEY (broadcast_id, user_id)
+                    )
+                ''')
+                
+                # Add columns introduced after the initial schema
+                self._add_column_if_missing(cursor, 'broadcasts', 'staging_msg_id', 'INTEGER')
+                self._add_column_if_missing(cursor, 'users', 'force_subscribed', 'BOOLEAN')
+                
                 # Create indexes for better performance
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_user_id ON users (user_id)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_bcast ON users (subscription_status, last_activity)')
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_queue_user_status ON file_queue (user_id, status)')
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_queue_status ON file_queue (status)')
                 cursor.execute('CREATE INDEX IF NOT EXISTS idx_patterns_user ON rename_patterns (user_id)')
@@ -176,6 +218,24 @@ class Database:
             logger.error(f"Database initialization failed: {e}")
             raise
     
+    def _add_column_if_missing(self, cursor, table: str, column: str, column_type: str):
+        """Add a column to an existing table if it is not there yet"""
+        cursor.execute(f'PRAGMA table_info({table})')
+        if column not in [row['name'] for row in cursor.fetchall()]:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+    
+    def read_conn(self) -> sqlite3.Connection:
+        """Get this thread's read-only connection; in WAL mode reads don't need self.lock"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            uri = f"{Path(self.db_path).resolve().as_uri()}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=256)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            with self.lock:
+                self._read_connections.append(conn)
+        return conn
+    
     def add_user(self, user_id: int, username: str = None, first_name: str = None, last_name: str = None):
         """Add or update user in database"""
         try:
@@ -191,6 +251,38 @@ class Database:
         except Exception as e:
             logger.error(f"Failed to add user {user_id}: {e}")
     
+    def add_users_bulk(self, rows: List[Tuple[int, str, str, str]]):
+        """Add or update several (user_id, username, first_name, last_name) rows in one transaction"""
+        try:
+            with self.lock:
+                cursor = self.connection.cursor()
+                cursor.executemany('''
+                    INSERT INTO users (user_id, username, first_name, last_name, last_activity)
+                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        username = excluded.username,
+                        first_name = excluded.first_name,
+                        last_name = excluded.last_name,
+                        last_activity = CURRENT_TIMESTAMP
+                ''', rows)
+                self.connection.commit()
+                
+        except Exception as e:
+            logger.error(f"Failed to add {len(rows)} users: {e}")
+    
+    def set_permanent_thumbnails_bulk(self, rows: List[Tuple[Optional[bytes], int]]) -> bool:
+        """Set or clear (thumbnail, user_id) permanent thumbnails in one transaction"""
+        try:
+            with self.lock:
+                cursor = self.connection.cursor()
+                cursor.executemany('UPDATE users SET permanent_thumbnail = ? WHERE user_id = ?', rows)
+                self.connection.commit()
+                return True
+                
+        except Exception as e:
+            logger.error(f"Failed to store {len(rows)} permanent thumbnails: {e}")
+            return False
+    
     def get_user(self, user_id: int) -> Optional[Dict]:
         """Get user data from database"""
         try:
@@ -207,6 +299,19 @@ class Database:
             logger.error(f"Failed to get user {user_id}: {e}")
             return None
     
+    def get_permanent_thumbnail(self, user_id: int) -> Optional[bytes]:
+        """Get only the user's permanent thumbnail, without the rest of the row"""
+        try:
+            # Read-only connection: callers on the event loop must not wait behind the writers
+            cursor = self.read_conn().cursor()
+            cursor.execute('SELECT permanent_thumbnail FROM users WHERE user_id = ?', (user_id,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+                
+        except Exception as e:
+            logger.error(f"Failed to get permanent thumbnail for user {user_id}: {e}")
+            return None
+    
     def update_user_activity(self, user_id: int):
         """Update user's last activity timestamp"""
         try:
@@ -221,18 +326,33 @@ class Database:
         except Exception as e:
             logger.error(f"Failed to update activity for user {user_id}: {e}")
     
+    def update_user_subscriptions_bulk(self, rows: List[Tuple[bool, int]]) -> bool:
+        """Set the force-subscribe status for several (subscribed, user_id) rows in one transaction"""
+        try:
+            with self.lock:
+                cursor = self.connection.cursor()
+                cursor.executemany('UPDATE users SET force_subscribed = ? WHERE user_id = ?', rows)
+                self.connection.commit()
+                return True
+                
+        except Exception as e:
+            logger.error(f"Failed to update subscription status for {len(rows)} users: {e}")
+            return False
+    
     def set_user_preference(self, user_id: int, key: str, value: Any):
         """Set user preference"""
         try:
             with self.lock:
-                user = self.get_user(user_id)
-                if not user:
+                # Read through the cursor: get_user would take self.lock again and deadlock
+                cursor = self.connection.cursor()
+                cursor.execute('SELECT preferences FROM users WHERE user_id = ?', (user_id,))
+                row = cursor.fetchone()
+                if not row:
                     return False
                 
-                preferences = json.loads(user.get('preferences', '{}'))
+                preferences = json.loads(row['preferences'] or '{}')
                 preferences[key] = value
                 
-                cursor = self.connection.cursor()
                 cursor.execute('''
                     UPDATE users SET preferences = ? WHERE user_id = ?
                 ''', (json.dumps(preferences), user_id))
@@ -243,6 +363,20 @@ class Database:
             logger.error(f"Failed to set preference for user {user_id}: {e}")
             return False
     
+    def get_user_preferences(self, user_id: int) -> Dict[str, Any]:
+        """Get all of a user's preferences"""
+        try:
+            with self.lock:
+                cursor = self.connection.cursor()
+                cursor.execute('SELECT preferences FROM users WHERE user_id = ?', (user_id,))
+                row = cursor.fetchone()
+            
+            return json.loads(row['preferences'] or '{}') if row else {}
+            
+        except Exception as e:
+            logger.error(f"Failed to get preferences for user {user_id}: {e}")
+            return {}
+    
     def get_user_preference(self, user_id: int, key: str, default: Any = None) -> Any:
         """Get user preference"""
         try:
@@ -257,6 +391,38 @@ class Database:
             logger.error(f"Failed to get preference for user {user_id}: {e}")
             return default
     
+    def store_temp_files_bulk(self, rows: List[Tuple[int, Dict]]) -> bool:
+        """Store received file info for several (user_id, file_info) pairs in one transaction"""
+        try:
+            with self.lock:
+                cursor = self.connection.cursor()
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO temp_files (user_id, file_id, file_info)
+                    VALUES (?, ?, ?)
+                ''', [(user_id, file_info['file_id'], json.dumps(file_info)) for user_id, file_info in rows])
+                self.connection.commit()
+                return True
+                
+        except Exception as e:
+            logger.error(f"Failed to store {len(rows)} temp files: {e}")
+            return False
+    
+    def get_temp_file(self, user_id: int, file_id: str) -> Optional[Dict]:
+        """Get stored file info for a received file"""
+        try:
+            with self.lock:
+                cursor = self.connection.cursor()
+                cursor.execute('''
+                    SELECT file_info FROM temp_files WHERE user_id = ? AND file_id = ?
+                ''', (user_id, file_id))
+                
+                row = cursor.fetchone()
+                return json.loads(row['file_info']) if row else None
+                
+        except Exception as e:
+            logger.error(f"Failed to get temp file {file_id} for user {user_id}: {e}")
+            return None
+    
     def add_to_queue(self, user_id: int, file_id: str, original_name: str, 
                      new_name: str, operation_type: str, priority: int = 0) -> int:
         """Add file to processing queue"""
@@ -343,6 +509,27 @@ class Database:
             logger.error(f"Failed to get user queue {user_id}: {e}")
             return []
     
+    def get_user_queue_counts(self, user_id: int) -> Dict[str, int]:
+        """Get user's queue item counts per status, plus the total"""
+        counts = {'pending': 0, 'processing': 0, 'completed': 0, 'failed': 0, 'total': 0}
+        try:
+            with self.lock:
+                cursor = self.connection.cursor()
+                cursor.execute('''
+                    SELECT status, COUNT(*) FROM file_queue 
+                    WHERE user_id = ? 
+                    GROUP BY status
+                ''', (user_id,))
+                
+                for status, count in cursor.fetchall():
+                    counts[status] = count
+                    counts['total'] += count
+                
+        except Exception as e:
+            logger.error(f"Failed to get user queue counts {user_id}: {e}")
+        
+        return counts
+    
     def get_pending_queue_items(self, limit: int = 10) -> List[Dict]:
         """Get pending queue items for processing"""
         try:
@@ -459,6 +646,35 @@ class Database:
             logger.error(f"Failed to get statistics: {e}")
             return {}
     
+    def get_stats_bundle(self, user_id: int) -> Dict[str, Any]:
+        """Get a user's statistics and the total user count in one query"""
+        bundle = {'user': {}, 'total': 0}
+        try:
+            with self.lock:
+                cursor = self.connection.cursor()
+                cursor.execute('''
+                    SELECT (SELECT COUNT(*) FROM users) AS total_users,
+                           u.total_files, u.total_size, u.join_date, u.last_activity
+                    FROM (SELECT ? AS user_id) q
+                    LEFT JOIN users u ON u.user_id = q.user_id
+                ''', (user_id,))
+                row = cursor.fetchone()
+                
+                bundle['total'] = row['total_users']
+                if row['join_date'] is not None:
+                    bundle['user'] = {
+                        'total_files': row['total_files'],
+                        'files_processed': row['total_files'],
+                        'total_size': row['total_size'],
+                        'first_used': row['join_date'],
+                        'last_active': row['last_activity']
+                    }
+                
+        except Exception as e:
+            logger.error(f"Failed to get stats bundle for user {user_id}: {e}")
+        
+        return bundle
+    
     def cleanup_old_logs(self, days: int = 7):
         """Clean up old log entries"""
         try:
@@ -466,8 +682,8 @@ class Database:
                 cursor = self.connection.cursor()
                 cursor.execute('''
                     DELETE FROM bot_logs 
-                    WHERE timestamp < datetime('now', '-{} days')
-                '''.format(days))
+                    WHERE timestamp < datetime('now', ?)
+                ''', (f'-{int(days)} days',))
                 self.connection.commit()
                 logger.info(f"Cleaned up logs older than {days} days")
                 
@@ -477,6 +693,11 @@ class Database:
     def close(self):
         """Close database connection"""
         try:
+            with self.lock:
+                for conn in self._read_connections:
+                    conn.close()
+                self._read_connections.clear()
+            
             if self.connection:
                 self.connection.close()
                 logger.info("Database connection closed")
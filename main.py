@@ -8,6 +8,9 @@ import logging
 import os
 import threading
 import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from requests.adapters import HTTPAdapter
 import telebot
 from telebot import types
 from bot.handlers import BotHandlers
@@ -27,14 +30,50 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Only the update kinds registered in setup_handlers; Telegram drops the rest server-side
+_ALLOWED_UPDATES = ['message', 'callback_query']
+
+def _make_webhook_handler(bot: telebot.TeleBot, path: str, secret: str):
+    """Build the HTTP handler that feeds webhook updates into the bot"""
+    
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != path or (secret and self.headers.get('X-Telegram-Bot-Api-Secret-Token') != secret):
+                self.send_response(403)
+                self.end_headers()
+                return
+            
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            update = types.Update.de_json(body.decode('utf-8'))
+            # Handlers run on telebot's worker pool, so the response goes out right away
+            bot.process_new_updates([update])
+            
+            self.send_response(200)
+            self.end_headers()
+        
+        def log_message(self, format, *args):
+            # One access line per update would flood bot.log
+            pass
+    
+    return WebhookHandler
+
 class TelegramBot:
     def __init__(self):
         self.config = Config()
         self.database = Database()
-        self.bot = telebot.TeleBot(self.config.BOT_TOKEN)
+        # Long polling holds getUpdates open for 20s; reads must outlast it
+        telebot.apihelper.CONNECT_TIMEOUT = 20
+        telebot.apihelper.READ_TIMEOUT = 25
+        # One shared keep-alive pool, large enough for every handler worker
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=2))
+        telebot.apihelper.CUSTOM_SESSION = session
+        # Handlers block on Telegram round-trips, so run enough workers to overlap them
+        self.bot = telebot.TeleBot(self.config.BOT_TOKEN, num_threads=self.config.HANDLER_THREADS)
         self.handlers = BotHandlers(self.database, self.config, self.bot)
         self.monitoring = BotMonitoring(self.config)
         self.monitoring_thread = None
+        self.webhook_server = None
         
     def setup_handlers(self):
         """Setup all bot command and message handlers"""
@@ -183,6 +222,24 @@ class TelegramBot:
         self.monitoring_thread.start()
         logger.info("24x7 Monitoring system started")
     
+    def run_webhook(self):
+        """Receive updates through a webhook instead of getUpdates polling"""
+        path = f"/{self.config.BOT_TOKEN}"
+        
+        self.bot.remove_webhook()
+        self.bot.set_webhook(
+            url=self.config.WEBHOOK_URL.rstrip('/') + path,
+            secret_token=self.config.WEBHOOK_SECRET or None,
+            allowed_updates=_ALLOWED_UPDATES
+        )
+        
+        self.webhook_server = ThreadingHTTPServer(
+            (self.config.WEBHOOK_LISTEN, self.config.WEBHOOK_PORT),
+            _make_webhook_handler(self.bot, path, self.config.WEBHOOK_SECRET)
+        )
+        logger.info(f"Webhook listening on {self.config.WEBHOOK_LISTEN}:{self.config.WEBHOOK_PORT}")
+        self.webhook_server.serve_forever()
+    
     def start_bot(self):
         """Start the bot with error handling and auto-restart capability"""
         max_retries = 5
@@ -201,9 +258,12 @@ class TelegramBot:
                 # Start monitoring
                 self.start_monitoring()
                 
-                # Start polling
+                # Start receiving updates
                 logger.info("Bot started successfully! Listening for messages...")
-                self.bot.infinity_polling(timeout=10, long_polling_timeout=5)
+                if self.config.WEBHOOK_URL:
+                    self.run_webhook()
+                else:
+                    self.bot.infinity_polling(timeout=20, long_polling_timeout=20, allowed_updates=_ALLOWED_UPDATES)
                 
             except Exception as e:
                 retry_count += 1
@@ -224,6 +284,9 @@ class TelegramBot:
         try:
             self.bot.stop_polling()
             
+            if self.webhook_server:
+                self.webhook_server.server_close()
+            
             # Close database connection
             self.database.close()
             